@@ -0,0 +1,100 @@
+import threading
+import time
+
+
+# Denoiser tiers from best quality to cheapest (Denoiser model_name values)
+DEFAULT_TIERS = ("master64", "dns48", "spectral", "highpass")
+
+
+class LoadGovernor:
+    """
+    Chooses the denoiser tier from measured processing load.
+
+    Every stage reports (elapsed, audio duration). The governor keeps a
+    smoothed real-time factor per stage, plus the load: processing seconds
+    per second of audio over the last window, summed over stages. That is
+    what one session's chunk costs relative to real time whatever the
+    number of sessions, which raise it only by competing for the CPU.
+    Sustained load above `high_load` steps one tier down. Load must then
+    stay below `low_load` for longer before a tier is won back (hysteresis).
+    """
+
+    def __init__(self, tiers=DEFAULT_TIERS, high_load=0.8, low_load=0.4,
+                 window_s=1.0, degrade_after=2, recover_after=5, smoothing=0.8):
+        """
+        tiers: engine names, best first
+        high_load: load (processing s / audio s per chunk) above which we degrade
+        low_load: load below which we may recover
+        window_s: length of one load measurement window
+        degrade_after: consecutive overloaded windows before stepping down
+        recover_after: consecutive idle-enough windows before stepping up
+        smoothing: EMA weight of the old value for per-stage RTF
+        """
+        self.tiers = tuple(tiers)
+        self.high_load = high_load
+        self.low_load = low_load
+        self.window_s = window_s
+        self.degrade_after = degrade_after
+        self.recover_after = recover_after
+        self.smoothing = smoothing
+
+        self.level = 0
+        self.load = 0.0
+        self.stage_rtf = {}
+
+        self._busy = {}  # stage -> [elapsed s, audio s] this window
+        self._window_start = time.monotonic()
+        self._over = 0
+        self._under = 0
+        self._lock = threading.Lock()
+
+    @property
+    def tier(self):
+        """Name of the currently selected tier."""
+        return self.tiers[self.level]
+
+    def record(self, stage, elapsed, duration):
+        """
+        Report one stage run.
+        stage: stage name, e.g. "denoise"
+        elapsed: wall-clock seconds spent
+        duration: seconds of audio processed
+        """
+        rtf = elapsed / duration if duration > 0 else 0.0
+        with self._lock:
+            previous = self.stage_rtf.get(stage)
+            self.stage_rtf[stage] = rtf if previous is None else (
+                self.smoothing * previous + (1 - self.smoothing) * rtf
+            )
+            totals = self._busy.setdefault(stage, [0.0, 0.0])
+            totals[0] += elapsed
+            totals[1] += duration
+            self._maybe_close_window()
+
+    def _maybe_close_window(self):
+        now = time.monotonic()
+        wall = now - self._window_start
+        if wall < self.window_s:
+            return
+
+        self.load = sum(elapsed / duration for elapsed, duration in self._busy.values() if duration > 0)
+        self._busy = {}
+        self._window_start = now
+
+        if self.load > self.high_load:
+            self._over += 1
+            self._under = 0
+        elif self.load < self.low_load:
+            self._under += 1
+            self._over = 0
+        else:
+            self._over = self._under = 0
+
+        if self._over >= self.degrade_after and self.level < len(self.tiers) - 1:
+            self.level += 1
+            self._over = 0
+            print(f"Load {self.load:.2f}: degrading denoiser to {self.tier}")
+        elif self._under >= self.recover_after and self.level > 0:
+            self.level -= 1
+            self._under = 0
+            print(f"Load {self.load:.2f}: restoring denoiser to {self.tier}")
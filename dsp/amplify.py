@@ -8,6 +8,8 @@ Created on Sat Oct  4 16:10:45 2025
 
 import numpy as np
 
+from dsp.kernels import follow_level, lookahead_gain
+
 
 def apply_gain(audio, gain):
     """
@@ -55,4 +57,143 @@ def apply_gain(audio, gain):
 def apply_simple_gain(audio, gain):
     """Simple gain application (original function)."""
     amplified = audio * gain
-    return np.clip(amplified, -1.0, 1.0)
\ No newline at end of file
+    return np.clip(amplified, -1.0, 1.0)
+
+class AutomaticGainControl:
+    """
+    Smoothed automatic gain control with a look-ahead peak limiter.
+    
+    The level is measured per short block with a peak-hold follower: it
+    jumps up to louder blocks and decays with `release_ms`, holding still
+    through blocks quieter than the gate. A one-pole filter with `attack_ms`
+    then smooths that level, so the gain moves smoothly instead of jumping
+    between chunks, and the gain is ramped sample by sample between blocks.
+    A limiter looks `lookahead_ms` ahead and pulls the gain down before a
+    peak arrives, so the output never exceeds `ceiling`. That delays the
+    output by the look-ahead.
+    
+    Works on one stream (samples,) / (samples, 1) or on many sessions at
+    once (sessions, samples), with state kept per row. Processing runs in
+    float32 on a single working buffer, with no per-sample Python loops.
+    """
+    
+    def __init__(self, samplerate=16000, target_rms=0.1, max_gain=20.0, min_gain=1.0,
+                 attack_ms=10.0, release_ms=300.0, block_ms=4.0, gate_rms=0.002,
+                 lookahead_ms=5.0, ceiling=0.98):
+        """
+        target_rms: output RMS the gain steers towards
+        max_gain, min_gain: gain limits (linear)
+        attack_ms: smoothing time constant of the level
+        release_ms: time for the held level to decay after a louder block
+        block_ms: level measurement block (gain is ramped within blocks)
+        gate_rms: blocks quieter than this hold the gain (no boosting of silence)
+        lookahead_ms: limiter look-ahead, also the added latency
+        ceiling: limiter output peak
+        """
+        self.sr = samplerate
+        self.target_rms = target_rms
+        self.max_gain = max_gain
+        self.min_gain = min_gain
+        self.block = max(1, int(samplerate * block_ms / 1000))
+        self.attack = float(np.exp(-self.block / (samplerate * attack_ms / 1000)))
+        self.release = float(np.exp(-self.block / (samplerate * release_ms / 1000)))
+        self.gate_rms = gate_rms
+        self.lookahead = max(1, int(samplerate * lookahead_ms / 1000))
+        self.ceiling = ceiling
+        self.latency = self.lookahead
+        self._sessions = None
+    
+    def reset(self, sessions=1):
+        """Start fresh state for `sessions` parallel streams."""
+        L = self.lookahead
+        self._sessions = sessions
+        self._held = np.full(sessions, self.target_rms)                   # peak-hold level
+        self._level_zi = np.full((sessions, 1), self.attack * self.target_rms)  # attack smoother state
+        self._gain = np.ones(sessions, dtype=np.float32)
+        self._delay = np.zeros((sessions, L), dtype=np.float32)         # delayed output samples
+        self._required = np.ones((sessions, L), dtype=np.float32)       # limiter gain history
+        self._window_min = np.ones((sessions, L), dtype=np.float32)     # look-ahead minima history
+    
+    def _block_gains(self, audio):
+        """Per-block gains (sessions, blocks + 1), including the previous block's."""
+        sessions, n = audio.shape
+        n_blocks = -(-n // self.block)
+        padded = np.zeros((sessions, n_blocks * self.block), dtype=np.float32)
+        padded[:, :n] = audio
+        blocks = padded.reshape(sessions, n_blocks, self.block)
+        power = np.einsum("sbk,sbk->sb", blocks, blocks)
+        counts = np.minimum(self.block, n - np.arange(n_blocks) * self.block)
+        rms = np.sqrt(power / counts)
+        
+        level, self._held, self._level_zi = follow_level(rms, self._held, self._level_zi,
+                                                         self.attack, self.release, self.gate_rms)
+        
+        gains = np.empty((sessions, n_blocks + 1), dtype=np.float32)
+        gains[:, 0] = self._gain
+        np.clip(self.target_rms / (level + 1e-9), self.min_gain, self.max_gain, out=gains[:, 1:])
+        self._gain = gains[:, -1].copy()
+        return gains
+    
+    def _limit(self, out):
+        """Look-ahead limiter, in place on `out` (sessions, samples)."""
+        L = self.lookahead
+        n = out.shape[1]
+        
+        # Delay the signal by the look-ahead
+        delayed = np.concatenate([self._delay, out], axis=1)
+        self._delay = delayed[:, -L:].copy()
+        out[:] = delayed[:, :n]
+        
+        # Only rows with a peak over the ceiling (now or still in the
+        # limiter's memory) need the gain computation
+        peak = np.abs(delayed[:, L:]).max(axis=1)
+        rows = np.flatnonzero((peak > self.ceiling) | (self._window_min.min(axis=1) < 1.0))
+        if len(rows) == 0:
+            return out
+        
+        # Gain each sample needs to stay under the ceiling
+        required = np.abs(delayed[rows, L:])
+        np.maximum(required, self.ceiling, out=required)
+        np.divide(self.ceiling, required, out=required)
+        required = np.concatenate([self._required[rows], required], axis=1)
+        
+        # Minimum over the look-ahead window ending at each sample, then a
+        # box average over the same length: smooth, and still below the
+        # required gain of the sample it lands on after the delay
+        smoothed, self._window_min[rows] = lookahead_gain(required, self._window_min[rows], L)
+        
+        self._required[rows] = required[:, -L:]
+        out[rows] *= smoothed.astype(np.float32)
+        return out
+    
+    def process(self, audio):
+        """
+        Apply AGC and limiting to the next chunk.
+        audio: numpy array (samples,), (samples, 1) or (sessions, samples)
+        returns: float32 numpy array same shape as input, delayed by `latency` samples
+        """
+        original_shape = audio.shape
+        if audio.ndim == 1 or (audio.ndim == 2 and audio.shape[1] == 1):
+            audio = audio.reshape(1, -1)
+        
+        # One float32 working buffer; everything below happens in place on it
+        out = np.array(audio, dtype=np.float32)
+        sessions, n = out.shape
+        if self._sessions != sessions:
+            self.reset(sessions)
+        
+        gains = self._block_gains(out)
+        
+        # Ramp the gain linearly across each block
+        frac = np.arange(self.block, dtype=np.float32) / self.block
+        if n % self.block == 0:
+            blocks = out.reshape(sessions, -1, self.block)
+            blocks *= gains[:, :-1, np.newaxis] + np.diff(gains, axis=1)[:, :, np.newaxis] * frac
+        else:
+            index = np.arange(n) // self.block
+            ramp = gains[:, index]
+            ramp += (gains[:, index + 1] - ramp) * np.resize(frac, n)
+            out *= ramp
+        
+        self._limit(out)
+        return out.reshape(original_shape)
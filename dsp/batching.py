@@ -0,0 +1,122 @@
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class BatchScheduler:
+    """
+    Cross-session micro-batching for denoiser inference.
+
+    Chunks submitted from any session are collected for up to `max_wait_ms`
+    (or until `max_batch_size` are pending) and run through the model as one
+    (B, 1, T) batch. Each caller gets its own result back through a Future.
+    """
+
+    def __init__(self, denoiser, max_batch_size=8, max_wait_ms=5.0, sr=16000):
+        """
+        denoiser: shared Denoiser instance (must provide process_batch)
+        max_batch_size: largest number of chunks in one forward pass
+        max_wait_ms: how long the first pending chunk may wait for company
+        sr: sample rate of submitted chunks
+        """
+        self.denoiser = denoiser
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait_ms / 1000.0
+        self.sr = sr
+
+        # Simple counters for tuning batch size / wait time
+        self.batches = 0
+        self.chunks = 0
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="denoiser-batcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def mean_batch_size(self):
+        """Average number of chunks per forward pass so far."""
+        return self.chunks / self.batches if self.batches else 0.0
+
+    def submit(self, sid, audio):
+        """
+        Queue one chunk for denoising.
+        sid: session id the chunk belongs to
+        audio: numpy array (frame_len, 1) or (frame_len,)
+        returns: Future resolving to the denoised chunk, same shape as input
+        """
+        if self._closed:
+            raise RuntimeError("BatchScheduler is closed")
+
+        future = Future()
+        self._queue.put((sid, audio, future))
+        return future
+
+    def process(self, sid, audio, timeout=None):
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(sid, audio).result(timeout=timeout)
+
+    def close(self):
+        """Stop the worker thread after the queued chunks are served."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._run_batch(batch)
+            if stop:
+                return
+
+    def _run_batch(self, batch):
+        # Only equal-length chunks can share a tensor; browsers normally
+        # send a fixed block size so this is a single group in practice
+        groups = defaultdict(list)
+        for sid, audio, future in batch:
+            if future.set_running_or_notify_cancel():
+                groups[audio.shape[0]].append((audio, future))
+
+        for items in groups.values():
+            try:
+                stacked = np.stack([
+                    audio[:, 0] if audio.ndim == 2 else audio
+                    for audio, _ in items
+                ])
+                denoised = self.denoiser.process_batch(stacked, sr=self.sr)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.chunks += len(items)
+
+            for (audio, future), out in zip(items, denoised):
+                if audio.ndim == 2:
+                    out = out.reshape(-1, 1)
+                future.set_result(out)
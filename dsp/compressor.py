@@ -0,0 +1,237 @@
+import time
+from functools import lru_cache
+
+import numpy as np
+import scipy.signal as sp
+
+from dsp.kernels import follow_level
+
+
+# Crossovers (Hz) and per-band settings tuned for whispered speech: the
+# consonant bands are compressed harder and lifted, the rumble band is left alone
+DEFAULT_CROSSOVERS = (300, 1500, 4000)
+DEFAULT_THRESHOLDS_DB = (-30.0, -36.0, -40.0, -40.0)
+DEFAULT_RATIOS = (1.5, 2.5, 3.0, 3.0)
+DEFAULT_MAKEUP_DB = (0.0, 3.0, 6.0, 4.0)
+
+
+@lru_cache(maxsize=16)
+def _crossover_bank(crossovers, sr):
+    """
+    Linkwitz-Riley (LR4) crossover filters, designed once per setting.
+    returns: list of (lowpass_sos, highpass_sos, allpass_sos) per crossover;
+             the allpass has the phase of lowpass + highpass and keeps lower
+             bands aligned with the splits made above them
+    """
+    bank = []
+    for freq in crossovers:
+        lp_b, lp_a = sp.butter(2, freq, btype="low", fs=sr)
+        hp_b, hp_a = sp.butter(2, freq, btype="high", fs=sr)
+        # LR4 = Butterworth squared; LP4 + HP4 = (lp_b^2 + hp_b^2) / a^2
+        lowpass = np.concatenate([sp.tf2sos(lp_b, lp_a)] * 2)
+        highpass = np.concatenate([sp.tf2sos(hp_b, hp_a)] * 2)
+        allpass = sp.tf2sos(np.polymul(lp_b, lp_b) + np.polymul(hp_b, hp_b), np.polymul(lp_a, lp_a))
+        bank.append((lowpass, highpass, allpass))
+    return bank
+
+
+class MultibandCompressor:
+    """
+    Multiband downward compressor for speech intelligibility.
+
+    The signal is split into len(crossovers) + 1 bands with phase-aligned
+    LR4 crossovers, so the bands sum back flat when no gain is applied.
+    Each band's level is followed per block (attack/release, state kept
+    across chunks). The compression gain is ramped through the block and
+    the bands are summed. Works on one stream (samples,) / (samples, 1) or
+    on (sessions, samples) in one call.
+
+    The processing cost of every call is measured in CPU time of the calling
+    thread (`last_cost_ms`, `cost_ms` smoothed), so time spent waiting for
+    the GIL or a core does not count. When it exceeds `budget_ms` the
+    compressor fades out over one chunk and passes audio through
+    (`bypassed`), then fades back in with fresh state after `retry_s` of
+    audio to measure again.
+    With budget_action="warn", `over_budget` is only reported.
+    """
+
+    def __init__(self, samplerate=16000, crossovers=DEFAULT_CROSSOVERS,
+                 thresholds_db=DEFAULT_THRESHOLDS_DB, ratios=DEFAULT_RATIOS,
+                 makeup_db=DEFAULT_MAKEUP_DB, attack_ms=5.0, release_ms=80.0,
+                 block_ms=4.0, budget_ms=2.0, budget_action="bypass", retry_s=10.0):
+        """
+        crossovers: band edges in Hz, ascending (2 or 3 edges for 3-4 bands)
+        thresholds_db: per-band level above which the band is compressed
+        ratios: per-band compression ratios
+        makeup_db: per-band gain applied after compression
+        attack_ms, release_ms: level follower times
+        block_ms: level measurement block
+        budget_ms: per-chunk processing budget (one 4096-sample chunk per session)
+        budget_action: "bypass" (stop compressing while over budget) or "warn"
+        retry_s: seconds of bypassed audio before compressing is tried again
+        """
+        if budget_action not in ("bypass", "warn"):
+            raise ValueError(f"Unknown budget action: {budget_action}")
+        n_bands = len(crossovers) + 1
+        if not (len(thresholds_db) == len(ratios) == len(makeup_db) == n_bands):
+            raise ValueError("Need one threshold, ratio and makeup gain per band")
+
+        self.sr = samplerate
+        self.crossovers = tuple(crossovers)
+        self.n_bands = n_bands
+        self.block = max(1, int(samplerate * block_ms / 1000))
+        self.attack = float(np.exp(-self.block / (samplerate * attack_ms / 1000)))
+        self.release = float(np.exp(-self.block / (samplerate * release_ms / 1000)))
+        self.budget_ms = budget_ms
+        self.budget_action = budget_action
+        self.retry_samples = int(retry_s * samplerate)
+
+        # Per-band constants shaped (bands, 1) to broadcast over blocks
+        self._threshold = np.asarray(thresholds_db, dtype=np.float64)[:, np.newaxis]
+        self._slope = (1.0 - 1.0 / np.asarray(ratios, dtype=np.float64))[:, np.newaxis]
+        self._makeup = np.asarray(makeup_db, dtype=np.float64)[:, np.newaxis]
+
+        self._bank = _crossover_bank(self.crossovers, samplerate)
+        self._sessions = None
+
+        # One throwaway chunk so first-call setup never counts against the budget
+        self._compress(np.zeros((1, 4096), dtype=np.float32))
+        self.last_cost_ms = 0.0
+        self.cost_ms = 0.0
+        self.bypassed = False
+        self._bypassed_samples = 0
+        self._sessions = None  # Start the first real chunk from fresh state
+
+    @property
+    def over_budget(self):
+        """Whether the smoothed per-chunk cost exceeds the budget."""
+        return self.cost_ms > self.budget_ms
+
+    def reset(self, sessions=1):
+        """Start fresh state for `sessions` parallel streams."""
+        self._sessions = sessions
+        # Filter states: one (sections, sessions, 2) array per filter
+        self._zi = [
+            [np.zeros((len(sos), sessions, 2)) for sos in filters]
+            for filters in self._bank
+        ]
+        # Allpass compensation applied to each lower band, per later crossover
+        self._ap_zi = {
+            (band, k): np.zeros((len(self._bank[k][2]), sessions, 2))
+            for band in range(self.n_bands - 1) for k in range(band + 1, len(self._bank))
+        }
+        self._held = np.full((sessions, self.n_bands), 1e-4)
+        self._level_zi = np.full((sessions, self.n_bands, 1), self.attack * 1e-4)
+        self._gain = np.ones((sessions, self.n_bands), dtype=np.float32)
+
+    def _filter(self, sos, audio, zi):
+        out, zi[...] = sp.sosfilt(sos, audio, axis=-1, zi=zi)
+        return out
+
+    def _split(self, audio):
+        """Bands (sessions, bands, samples), phase-aligned so they sum flat."""
+        bands = []
+        rest = audio
+        for k, (lowpass, highpass, _) in enumerate(self._bank):
+            zi = self._zi[k]
+            bands.append(self._filter(lowpass, rest, zi[0]))
+            rest = self._filter(highpass, rest, zi[1])
+        bands.append(rest)
+
+        # Lower bands pass through the allpass of every split made above them
+        for band in range(self.n_bands - 1):
+            for k in range(band + 1, len(self._bank)):
+                bands[band] = self._filter(self._bank[k][2], bands[band], self._ap_zi[(band, k)])
+
+        return np.stack(bands, axis=1).astype(np.float32)
+
+    def _block_gains(self, bands):
+        """Per-block linear gains (sessions, bands, blocks + 1), including the previous block's."""
+        sessions, n_bands, n = bands.shape
+        n_blocks = -(-n // self.block)
+        padded = np.zeros((sessions, n_bands, n_blocks * self.block), dtype=np.float32)
+        padded[..., :n] = bands
+        blocks = padded.reshape(sessions, n_bands, n_blocks, self.block)
+        power = np.einsum("sbnk,sbnk->sbn", blocks, blocks)
+        counts = np.minimum(self.block, n - np.arange(n_blocks) * self.block)
+        rms = np.sqrt(power / counts)
+
+        level, self._held, self._level_zi = follow_level(rms, self._held, self._level_zi,
+                                                         self.attack, self.release)
+
+        # Static curve: above threshold the level rises 1/ratio dB per dB
+        level_db = 20 * np.log10(level + 1e-9)
+        gain_db = self._makeup - self._slope * np.maximum(level_db - self._threshold, 0.0)
+
+        gains = np.empty((sessions, n_bands, n_blocks + 1), dtype=np.float32)
+        gains[..., 0] = self._gain
+        gains[..., 1:] = 10 ** (gain_db / 20)
+        self._gain = gains[..., -1].copy()
+        return gains
+
+    def process(self, audio):
+        """
+        Compress the next chunk.
+        audio: numpy array (samples,), (samples, 1) or (sessions, samples)
+        returns: float32 numpy array same shape as input
+        """
+        original_shape = audio.shape
+        if audio.ndim == 1 or (audio.ndim == 2 and audio.shape[1] == 1):
+            audio = audio.reshape(1, -1)
+        dry = np.asarray(audio, dtype=np.float32)
+        sessions, n = dry.shape
+
+        if self.bypassed:
+            self._bypassed_samples += n
+            if self._bypassed_samples < self.retry_samples:
+                return dry.reshape(original_shape)
+            # Retry with fresh state, fading from the dry signal back in
+            self.reset(sessions)
+            self.cost_ms = 0.0
+            self.bypassed = False
+            wet = self._measured(dry)
+            fade = np.linspace(0.0, 1.0, n, dtype=np.float32)
+            return (dry + fade * (wet - dry)).reshape(original_shape)
+
+        if self._sessions != sessions:
+            self.reset(sessions)
+        out = self._measured(dry)
+
+        if self.budget_action == "bypass" and self.over_budget:
+            # Fade out to the dry signal across this chunk, then pass through
+            fade = np.linspace(0.0, 1.0, n, dtype=np.float32)
+            out = out + fade * (dry - out)
+            self.bypassed = True
+            self._bypassed_samples = 0
+        return out.reshape(original_shape)
+
+    def _measured(self, audio):
+        """Compress and update the cost measurements."""
+        start = time.thread_time()
+        out = self._compress(audio)
+        sessions, n = audio.shape
+        # Cost per 4096-sample chunk per session, comparable to budget_ms
+        self.last_cost_ms = (time.thread_time() - start) * 1000 * 4096 / (n * sessions)
+        self.cost_ms = 0.9 * self.cost_ms + 0.1 * self.last_cost_ms if self.cost_ms else self.last_cost_ms
+        return out
+
+    def _compress(self, audio):
+        """Split, compress and sum (sessions, samples) float32 audio."""
+        sessions, n = audio.shape
+        if self._sessions != sessions:
+            self.reset(sessions)
+
+        bands = self._split(audio)
+        gains = self._block_gains(bands)
+
+        # Ramp each band's gain across its blocks, then sum the bands
+        frac = np.arange(self.block, dtype=np.float32) / self.block
+        if n % self.block == 0:
+            ramp = gains[..., :-1, np.newaxis] + np.diff(gains, axis=-1)[..., np.newaxis] * frac
+            out = np.einsum("sbnk,sbnk->snk", bands.reshape(ramp.shape), ramp).reshape(sessions, n)
+        else:
+            index = np.arange(n) // self.block
+            ramp = gains[..., index]
+            ramp += (gains[..., index + 1] - ramp) * np.resize(frac, n)
+            out = np.einsum("sbn,sbn->sn", bands, ramp)
+        return out
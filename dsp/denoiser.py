@@ -1,41 +1,140 @@
+import io
+from collections import OrderedDict
+from functools import lru_cache
 import torch
 import torchaudio
 import numpy as np
 import os
 import sys
+from scipy import signal
+
+from dsp.registry import registry
+from dsp.resample import Resampler, resample
+from dsp.spectral import SpectralGate, spectral_gate
 
 # Add Facebook denoiser path 
 
 try:
     from denoiser import pretrained
-    from denoiser.dsp import convert_audio
+    from denoiser.demucs import DemucsStreamer
 except ImportError:
     print("Warning: Facebook denoiser not available. Using fallback.")
     pretrained = None
-    convert_audio = None
+    DemucsStreamer = None
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+# Inference backends and the max absolute deviation from the eager model each
+# may show on the reference input before the Denoiser falls back to eager
+BACKEND_TOLERANCE = {
+    "eager": 0.0,
+    "torchscript": 1e-4,
+    "onnx": 1e-3,
+    "int8": 5e-2,
+}
+
+# Backends the streaming path can use: DemucsStreamer steps the model's own
+# encoder/LSTM/decoder modules, so an int8-quantized model streams, but traced
+# graphs and ONNX sessions (whole-chunk forward passes) cannot
+STREAM_BACKENDS = ("eager", "int8")
+
+# Traced graphs / ONNX sessions kept per Denoiser (least recently used dropped)
+MAX_COMPILED = 8
+
+
+def _batch_bucket(batch):
+    """Batch size a compiled graph is built for: the next power of two."""
+    return 1 << max(batch - 1, 0).bit_length()
+
+
+# Model frames per DemucsStreamer step. Each step re-runs the encoder over its
+# receptive field, so small steps cost far more per sample: one 4096-sample
+# chunk of dns48 on one core takes ~230 ms with 4 frames (89 ms latency),
+# ~89 ms with 16 (281 ms) and ~52 ms with 32 (537 ms), vs ~84 ms for the
+# stateless process() (master64: ~390, ~146, ~96 vs ~125 ms). No setting beats
+# process() on both cost and latency, so streaming is opt-in (server.py).
+DEFAULT_STREAM_FRAMES = int(os.environ.get("DENOISER_STREAM_FRAMES", 16))
+
+
+
+@lru_cache(maxsize=None)
+def _highpass_sos(sr):
+    """4th-order 300 Hz Butterworth high-pass, designed once per sample rate."""
+    return signal.butter(4, 300, btype='high', fs=sr, output='sos').astype(np.float32)
+
+
+class HighPassFilter:
+    """
+    Causal fallback denoiser: a high-pass filter whose state carries over
+    between chunks, so consecutive chunks are filtered without edge transients.
+    """
+    
+    def __init__(self, sr=16000):
+        self.sos = _highpass_sos(sr)
+        self._zi = None
+    
+    def reset(self):
+        """Forget the filter state (e.g. after a gap in the stream)."""
+        self._zi = None
+    
+    def process(self, audio):
+        """
+        Filter the next chunk.
+        audio: numpy array (samples,) for one session or (sessions, samples)
+        returns: float32 numpy array, same shape as input
+        """
+        audio = np.asarray(audio, dtype=np.float32)
+        
+        # One (sections, ..., 2) state per row; rebuilt if the batch shape changes
+        zi_shape = (len(self.sos),) + audio.shape[:-1] + (2,)
+        if self._zi is None or self._zi.shape != zi_shape:
+            self._zi = np.zeros(zi_shape, dtype=np.float32)
+        
+        filtered, self._zi = signal.sosfilt(self.sos, audio, axis=-1, zi=self._zi)
+        return filtered
 
 
 class Denoiser:
     """Facebook Denoiser wrapper (from facebook/denoiser repo)."""
     
-    def __init__(self, model_name="dns64", device="cpu"):
+    def __init__(self, model_name="dns64", device="cpu", backend="eager"):
         """
         Initialize Facebook Denoiser.
-        model_name: "dns48", "dns64", "master64" 
+        model_name: "dns48", "dns64", "master64", "spectral" (NumPy spectral gating)
+                    or "highpass" (fallback filter only)
         device: "cpu" or "cuda"
+        backend: "eager", "torchscript", "onnx" or "int8" (see BACKEND_TOLERANCE)
         """
+        if backend not in BACKEND_TOLERANCE:
+            raise ValueError(f"Unknown denoiser backend: {backend}")
+        
         self.device = device
         self.model_sr = 16000
+        self.backend = "eager"
+        self.backend_error = 0.0
+        self._compiled = OrderedDict()
+        self._stream_warned = False
         
-        if pretrained is None:
+        if model_name == "spectral":
+            # Middle tier: far cheaper than Demucs, much better than the high-pass
+            self.model = None
+            self.use_fallback = False
+        elif model_name == "highpass":
+            # Cheapest tier: the causal high-pass fallback, on purpose
+            self.model = None
+            self.use_fallback = True
+        elif pretrained is None:
             print("Warning: Facebook denoiser not available. Using fallback denoiser.")
             self.model = None
             self.use_fallback = True
         else:
             try:
                 print(f"Loading Facebook Denoiser model: {model_name}...")
-                self.model = pretrained.get_model(model_name).to(device)
-                self.model.eval()
+                # Weights are shared with every other Denoiser in this process
+                self.model = registry.get(model_name, device)
                 self.use_fallback = False
                 print("Denoiser loaded successfully")
             except Exception as e:
@@ -44,6 +143,134 @@ class Denoiser:
                 self.model = None
                 self.use_fallback = True
         
+        # Which engine process() runs: "model", "spectral" or "highpass"
+        if self.use_fallback:
+            self.engine = "highpass"
+        elif self.model is None:
+            self.engine = "spectral"
+        else:
+            self.engine = "model"
+        
+        # Human-readable tier name: the model name, "spectral" or "highpass"
+        self.name = model_name if self.engine == "model" else self.engine
+        
+        if self.engine == "model" and backend != "eager":
+            self._init_backend(backend)
+    
+    def _init_backend(self, backend):
+        """Switch to a non-eager backend and check it against the eager model."""
+        if backend == "onnx" and onnxruntime is None:
+            print("Warning: onnxruntime not available. Using eager backend.")
+            return
+        if backend == "int8" and self.device != "cpu":
+            print("Warning: int8 backend is CPU only. Using eager backend.")
+            return
+        
+        eager = self.model
+        if backend == "int8":
+            # Dynamic quantization covers the LSTM and its projection; torch
+            # has no dynamic int8 kernels for Conv1d, so convs stay float
+            self.model = torch.ao.quantization.quantize_dynamic(
+                eager, {torch.nn.LSTM, torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.backend = backend
+        
+        # Reference input: one browser-sized chunk of quiet noise
+        generator = torch.Generator().manual_seed(0)
+        reference = 0.1 * torch.randn(1, eager.chin, 4096, generator=generator)
+        reference = reference.to(self.device)
+        
+        try:
+            with torch.no_grad():
+                expected = eager(reference)
+                actual = self._infer(reference)
+            self.backend_error = float((expected - actual.to(expected.device)).abs().max())
+        except Exception as e:
+            print(f"Warning: {backend} backend failed: {e}")
+            self.backend_error = float("inf")
+        
+        tolerance = BACKEND_TOLERANCE[backend]
+        if self.backend_error > tolerance:
+            print(f"Warning: {backend} backend deviates from eager by {self.backend_error:.2e} "
+                  f"(tolerance {tolerance:.0e}). Using eager backend.")
+            self.model = eager
+            self.backend = "eager"
+            self._compiled.clear()
+        else:
+            print(f"Denoiser backend: {backend} (max deviation {self.backend_error:.2e})")
+    
+    def _compiled_for(self, audio_tensor, build):
+        """Cached compiled graph for this input shape, built on first use."""
+        key = tuple(audio_tensor.shape)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled = build(audio_tensor)
+            self._compiled[key] = compiled
+            if len(self._compiled) > MAX_COMPILED:
+                self._compiled.popitem(last=False)
+        else:
+            self._compiled.move_to_end(key)
+        return compiled
+    
+    def _infer(self, audio_tensor):
+        """Run one forward pass (batch, channels, samples) on the selected backend."""
+        if self.backend not in ("torchscript", "onnx"):
+            return self.model(audio_tensor)
+        
+        # Demucs pads to a valid length with Python arithmetic, so compiled
+        # graphs are specialised per input shape. Batches are zero-padded to
+        # a power of two (rows are normalised independently), so a handful of
+        # graphs covers every batch size and warm_up() can build them all
+        batch = audio_tensor.shape[0]
+        bucket = _batch_bucket(batch)
+        if bucket != batch:
+            padding = audio_tensor.new_zeros((bucket - batch,) + tuple(audio_tensor.shape[1:]))
+            audio_tensor = torch.cat([audio_tensor, padding])
+        
+        if self.backend == "torchscript":
+            traced = self._compiled_for(audio_tensor, self._trace)
+            return traced(audio_tensor)[:batch]
+        
+        session = self._compiled_for(audio_tensor, self._export_onnx)
+        out = session.run(None, {"audio": audio_tensor.cpu().numpy()})[0]
+        return torch.from_numpy(out[:batch])
+    
+    def _trace(self, audio_tensor):
+        """Trace and freeze the model for one input shape."""
+        traced = torch.jit.trace(self.model, audio_tensor, check_trace=False)
+        return torch.jit.freeze(traced.eval())
+    
+    def _export_onnx(self, audio_tensor):
+        """Export the model for one input shape and open an onnxruntime session."""
+        buffer = io.BytesIO()
+        torch.onnx.export(
+            self.model,
+            audio_tensor,
+            buffer,
+            input_names=["audio"],
+            output_names=["denoised"],
+            opset_version=17,
+            dynamo=False,
+        )
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        return onnxruntime.InferenceSession(
+            buffer.getvalue(), options, providers=["CPUExecutionProvider"]
+        )
+    
+    def warm_up(self, frame_len=4096, sr=16000, max_batch=1):
+        """
+        Run dummy chunks through the full path (resampling, backend graphs).
+        max_batch: largest batch process_batch() will see; every batch-size
+                   bucket up to it gets its compiled graph now
+        """
+        bucket = 1
+        while True:
+            self.process_batch(np.zeros((bucket, frame_len), dtype=np.float32), sr=sr)
+            if bucket >= max_batch or self.backend not in ("torchscript", "onnx"):
+                break
+            bucket *= 2
+        
     def process(self, audio, sr=16000):
         """
         Denoise audio chunk.
@@ -58,55 +285,154 @@ class Denoiser:
         if audio.ndim == 2:
             audio = audio[:, 0]
         
+        denoised = self.process_batch(audio[np.newaxis, :], sr=sr)[0]
+        
+        # Reshape to match input
+        if len(original_shape) == 2:
+            denoised = denoised.reshape(-1, 1)
+        
+        return denoised
+
+    def process_batch(self, batch, sr=16000):
+        """
+        Denoise several equal-length chunks in a single forward pass.
+        batch: numpy array (batch, frame_len), e.g. one row per session
+        sr: sample rate (will resample if needed)
+        returns: denoised numpy array (batch, frame_len)
+        """
+        batch = np.asarray(batch, dtype=np.float32)
+        frame_len = batch.shape[-1]
+        
         # Use fallback if model not available
         if self.use_fallback:
-            # Simple high-pass filter as fallback
-            from scipy import signal
-            b, a = signal.butter(4, 300, btype='high', fs=sr)
-            denoised = signal.filtfilt(b, a, audio)
-            
-            # Reshape to match input
-            if len(original_shape) == 2:
-                denoised = denoised.reshape(-1, 1)
-            return denoised
-        
-        # Convert to torch tensor (1, 1, samples) - batch, channels, samples
-        audio_tensor = torch.from_numpy(audio).float().unsqueeze(0).unsqueeze(0)
-        
-        # Resample if needed
+            # Simple high-pass filter as fallback (fresh state per call)
+            return HighPassFilter(sr).process(batch)
+        
+        if self.engine == "spectral":
+            return np.stack([spectral_gate(row, sr) for row in batch])
+        
+        # Resample if needed (filter designed once per rate pair)
         if sr != self.model_sr:
-            audio_tensor = convert_audio(
-                audio_tensor, 
-                sr, 
-                self.model_sr, 
-                self.model.chin
-            )
+            batch = resample(batch, sr, self.model_sr).astype(np.float32)
+        
+        # Convert to torch tensor (batch, 1, samples) - batch, channels, samples
+        audio_tensor = torch.from_numpy(batch).unsqueeze(1)
         
         # Move to device
         audio_tensor = audio_tensor.to(self.device)
         
         # Denoise
         with torch.no_grad():
-            denoised = self.model(audio_tensor)
+            denoised = self._infer(audio_tensor)
         
         # Convert back to numpy
-        denoised = denoised.squeeze().cpu().numpy()
+        denoised = denoised[:, 0].cpu().numpy()
         
-        # Resample back if needed
+        # Resample back if needed, trimming the rounding sample
         if sr != self.model_sr:
-            denoised_tensor = torch.from_numpy(denoised).unsqueeze(0).unsqueeze(0)
-            denoised_tensor = convert_audio(
-                denoised_tensor,
-                self.model_sr,
-                sr,
-                1
-            )
-            denoised = denoised_tensor.squeeze().cpu().numpy()
-        
-        # Reshape to match input
-        if len(original_shape) == 2:
-            denoised = denoised.reshape(-1, 1)
+            denoised = resample(denoised, self.model_sr, sr)[:, :frame_len]
         
         return denoised
 
+    def streamer(self, sr=16000, num_frames=DEFAULT_STREAM_FRAMES):
+        """
+        Create a per-session streaming denoiser sharing this model's weights.
+        sr: sample rate of the chunks that will be fed to the stream
+        num_frames: model frames processed per step (higher = more latency, better RTF)
+        """
+        if self.backend not in STREAM_BACKENDS and not self._stream_warned:
+            print(f"Warning: the {self.backend} backend does not apply to streaming; "
+                  f"streams run the eager model")
+            self._stream_warned = True
+        return DenoiserStream(self, sr=sr, num_frames=num_frames)
+
+
+class DenoiserStream:
+    """
+    Stateful streaming wrapper around the upstream DemucsStreamer.
+
+    Keeps the LSTM/conv state of one session between calls so each chunk only
+    pays for its new samples. The spectral and high-pass engines keep their
+    own per-session state the same way. Output is delayed by a fixed `latency` (in
+    samples at `sr`) so every call returns exactly as many samples as it got.
+    """
 
+    def __init__(self, denoiser, sr=16000, num_frames=DEFAULT_STREAM_FRAMES):
+        self.denoiser = denoiser
+        self.sr = sr
+
+        self._resample_in = None
+        self._resample_out = None
+        self._resample_delay = 0.0
+        
+        if denoiser.engine == "spectral":
+            self.streamer = None
+            self._gate = SpectralGate(sr)
+            self.latency = self._gate.latency
+        elif denoiser.use_fallback or DemucsStreamer is None:
+            self.streamer = None
+            self.latency = 0
+            self._highpass = HighPassFilter(sr)
+        else:
+            self.streamer = DemucsStreamer(denoiser.model, num_frames=num_frames)
+            self.latency = int(np.ceil(self.streamer.total_length * sr / denoiser.model_sr))
+            if sr != denoiser.model_sr:
+                # Stateful resamplers so chunk edges are filtered continuously
+                self._resample_in = Resampler(sr, denoiser.model_sr)
+                self._resample_out = Resampler(denoiser.model_sr, sr)
+                self._resample_delay = (self._resample_in.delay * sr / denoiser.model_sr
+                                        + self._resample_out.delay)
+                self.latency += 1  # resampled chunk lengths vary by one sample
+
+        # Output FIFO, primed with `latency` samples of silence
+        self._pending = np.zeros(self.latency, dtype=np.float32)
+
+    @property
+    def latency_ms(self):
+        """Algorithmic latency of the stream in milliseconds."""
+        return 1000.0 * (self.latency + self._resample_delay) / self.sr
+
+    def process(self, audio):
+        """
+        Denoise the next chunk of this session.
+        audio: numpy array (frame_len, 1) or (frame_len,) at the stream's sample rate
+        returns: denoised numpy array same shape as input, delayed by `latency`
+        """
+        if self.denoiser.engine == "spectral":
+            return self._gate.process(audio)
+        
+        if self.streamer is None:
+            # Fallback keeps its filter state for this session
+            denoised = self._highpass.process(audio[:, 0] if audio.ndim == 2 else audio)
+            return denoised.reshape(audio.shape)
+
+        original_shape = audio.shape
+        if audio.ndim == 2:
+            audio = audio[:, 0]
+
+        model_audio = audio
+        if self._resample_in is not None:
+            model_audio = self._resample_in.process(audio)
+
+        # (channels, samples) as expected by DemucsStreamer.feed
+        audio_tensor = torch.from_numpy(np.ascontiguousarray(model_audio, dtype=np.float32)).unsqueeze(0)
+
+        with torch.no_grad():
+            out = self.streamer.feed(audio_tensor.to(self.denoiser.device))
+
+        out = out[0].cpu().numpy()
+        if self._resample_out is not None and len(out):
+            out = self._resample_out.process(out)
+
+        self._pending = np.concatenate([self._pending, out])
+
+        n = len(audio)
+        denoised = self._pending[:n]
+        if len(denoised) < n:
+            denoised = np.pad(denoised, (0, n - len(denoised)))
+        self._pending = self._pending[n:]
+
+        if len(original_shape) == 2:
+            denoised = denoised.reshape(-1, 1)
+
+        return denoised
@@ -0,0 +1,150 @@
+import json
+from functools import lru_cache
+
+import numpy as np
+import scipy.signal as sp
+
+
+# Identity second-order section (b0 b1 b2 a0 a1 a2)
+_IDENTITY = np.array([[1.0, 0.0, 0.0, 1.0, 0.0, 0.0]])
+
+
+def _rbj(kind, freq, sr, gain_db=0.0, q=0.707):
+    """RBJ audio-EQ-cookbook biquad as one SOS row."""
+    A = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * freq / sr
+    cos_w0 = np.cos(w0)
+    alpha = np.sin(w0) / (2 * q)
+
+    if kind == "peaking":
+        b = [1 + alpha * A, -2 * cos_w0, 1 - alpha * A]
+        a = [1 + alpha / A, -2 * cos_w0, 1 - alpha / A]
+    elif kind == "lowshelf":
+        k = 2 * np.sqrt(A) * alpha
+        b = [A * ((A + 1) - (A - 1) * cos_w0 + k), 2 * A * ((A - 1) - (A + 1) * cos_w0),
+             A * ((A + 1) - (A - 1) * cos_w0 - k)]
+        a = [(A + 1) + (A - 1) * cos_w0 + k, -2 * ((A - 1) + (A + 1) * cos_w0),
+             (A + 1) + (A - 1) * cos_w0 - k]
+    elif kind == "highshelf":
+        k = 2 * np.sqrt(A) * alpha
+        b = [A * ((A + 1) + (A - 1) * cos_w0 + k), -2 * A * ((A - 1) + (A + 1) * cos_w0),
+             A * ((A + 1) + (A - 1) * cos_w0 - k)]
+        a = [(A + 1) - (A - 1) * cos_w0 + k, 2 * ((A - 1) - (A + 1) * cos_w0),
+             (A + 1) - (A - 1) * cos_w0 - k]
+    else:
+        raise ValueError(f"Unknown biquad type: {kind}")
+
+    b = np.asarray(b) / a[0]
+    a = np.asarray(a) / a[0]
+    return np.concatenate([b, a])[np.newaxis]
+
+
+def _mix(b, a, amount):
+    """SOS for x + amount * filter(x), where filter is the transfer function b/a."""
+    b = np.pad(b, (len(a) - len(b), 0)) if len(b) < len(a) else b
+    return sp.tf2sos(a + amount * b, a)
+
+
+def _effect_sos(effect, sr):
+    """
+    SOS rows and linear gain for one effect spec.
+    returns: (sos (sections, 6), gain)
+    """
+    kind = effect["type"]
+    nyquist = sr / 2
+
+    if kind == "gain":
+        return _IDENTITY[:0], 10 ** (effect.get("db", 0.0) / 20)
+    if kind == "preemphasis":
+        coef = effect.get("coef", 0.97)
+        return np.array([[1.0, -coef, 0.0, 1.0, 0.0, 0.0]]), 1.0
+    if kind in ("peaking", "lowshelf", "highshelf"):
+        return _rbj(kind, effect["freq"], sr, effect.get("gain_db", 0.0), effect.get("q", 0.707)), 1.0
+    if kind in ("highpass", "lowpass"):
+        return sp.butter(effect.get("order", 2), effect["freq"] / nyquist, btype=kind, output="sos"), 1.0
+    if kind == "band_boost":
+        # Adds a Butterworth band back onto the dry signal
+        b, a = sp.butter(effect.get("order", 2), [effect["low"] / nyquist, effect["high"] / nyquist],
+                         btype="band")
+        return _mix(b, a, effect.get("amount", 0.5)), 1.0
+    if kind == "high_boost":
+        b, a = sp.butter(effect.get("order", 1), effect["freq"] / nyquist, btype="high")
+        return _mix(b, a, effect.get("amount", 0.5)), 1.0
+
+    raise ValueError(f"Unknown effect type: {kind}")
+
+
+@lru_cache(maxsize=32)
+def _compile(spec, sr):
+    effects = json.loads(spec)
+    sections = []
+    gain = 1.0
+    for effect in effects:
+        sos, effect_gain = _effect_sos(effect, sr)
+        sections.append(sos)
+        gain *= effect_gain
+
+    sos = np.concatenate(sections + [np.empty((0, 6))])
+    if len(sos) == 0:
+        sos = _IDENTITY.copy()
+    # Overall gain folded into the first section: one sosfilt pass does everything
+    sos[0, :3] *= gain
+    return sos
+
+
+def compile_chain(effects, sr=16000):
+    """
+    Compile effect specs into one SOS cascade (cached per chain and rate).
+    effects: list of dicts, e.g. {"type": "peaking", "freq": 300, "gain_db": 3, "q": 1.0}
+             types: gain, preemphasis, peaking, lowshelf, highshelf, highpass,
+                    lowpass, band_boost, high_boost
+    returns: float64 array (sections, 6), shared between callers - do not modify
+    """
+    return _compile(json.dumps(list(effects), sort_keys=True), sr)
+
+
+class EffectsChain:
+    """
+    Declarative EQ chain compiled into a single SOS cascade.
+
+    Filter state carries across chunks, so consecutive chunks are filtered
+    as one continuous signal. Accepts one stream (samples,) / (samples, 1)
+    or many sessions at once (sessions, samples).
+    """
+
+    def __init__(self, effects, sr=16000):
+        """
+        effects: list of effect dicts (see compile_chain)
+        sr: sample rate
+        """
+        self.effects = list(effects)
+        self.sr = sr
+        self.sos = compile_chain(self.effects, sr)
+        self.reset()
+
+    @classmethod
+    def from_json(cls, path, sr=16000):
+        """Load a chain from a JSON file holding a list of effect dicts."""
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), sr)
+
+    def reset(self):
+        """Forget filter state (e.g. for a new stream)."""
+        self._zi = None
+
+    def process(self, audio):
+        """
+        Filter the next chunk.
+        audio: numpy array (samples,), (samples, 1) or (sessions, samples)
+        returns: float32 numpy array same shape as input
+        """
+        original_shape = audio.shape
+        if audio.ndim == 2 and audio.shape[1] == 1:
+            audio = audio[:, 0]
+
+        state_shape = (len(self.sos),) + audio.shape[:-1] + (2,)
+        if self._zi is None or self._zi.shape != state_shape:
+            self._zi = np.zeros(state_shape)
+
+        out, self._zi = sp.sosfilt(self.sos, audio, axis=-1, zi=self._zi)
+        return out.astype(np.float32, copy=False).reshape(original_shape)
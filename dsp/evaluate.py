@@ -0,0 +1,291 @@
+"""
+Offline objective-quality evaluation of the denoising engines.
+
+Runs a corpus of clean/noisy WAV pairs through one or more Denoiser engines,
+in worker processes, and scores noisy input and enhanced output against the
+clean reference:
+
+  seg_snr      segmental SNR (dB, per-frame values clipped to [-10, 35])
+  si_sdr       scale-invariant signal-to-distortion ratio (dB)
+  lsd          log-spectral distance (dB, lower is better)
+  intelligibility  STOI-style short-time envelope correlation (0..1)
+
+Usage:
+  python -m dsp.evaluate --clean data/clean --noisy data/noisy \
+      --engines dns64 dns48 spectral --csv report.csv --json report.json
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.fft import rfft
+from scipy.io import wavfile
+from scipy.signal import get_window
+
+from dsp.resample import pcm_to_float, resample
+
+
+METRICS = ("seg_snr", "si_sdr", "lsd", "intelligibility")
+
+
+# --- Metrics --------------------------------------------------------------
+
+def _frames(audio, frame_len, hop):
+    if len(audio) < frame_len:
+        audio = np.pad(audio, (0, frame_len - len(audio)))
+    return sliding_window_view(audio, frame_len)[::hop]
+
+
+def segmental_snr(clean, estimate, sr=16000, frame_ms=20, min_db=-10.0, max_db=35.0):
+    """Mean per-frame SNR of `estimate` against `clean`, each frame clipped to [min_db, max_db]."""
+    frame_len = int(sr * frame_ms / 1000)
+    clean_frames = _frames(clean, frame_len, frame_len)
+    error_frames = clean_frames - _frames(estimate, frame_len, frame_len)
+    signal = np.einsum("ij,ij->i", clean_frames, clean_frames)
+    noise = np.einsum("ij,ij->i", error_frames, error_frames)
+    snr = 10 * np.log10((signal + 1e-10) / (noise + 1e-10))
+    return float(np.mean(np.clip(snr, min_db, max_db)))
+
+
+def si_sdr(clean, estimate):
+    """Scale-invariant SDR (dB)."""
+    clean = clean - clean.mean()
+    estimate = estimate - estimate.mean()
+    scale = np.dot(estimate, clean) / (np.dot(clean, clean) + 1e-10)
+    target = scale * clean
+    residual = estimate - target
+    return float(10 * np.log10((np.dot(target, target) + 1e-10) / (np.dot(residual, residual) + 1e-10)))
+
+
+def _power_spectrogram(audio, n_fft, hop):
+    frames = _frames(audio, n_fft, hop) * get_window("hann", n_fft)
+    spectrum = rfft(frames, axis=1)
+    return spectrum.real ** 2 + spectrum.imag ** 2
+
+
+def log_spectral_distance(clean, estimate, n_fft=512, hop=256, floor_db=-80.0):
+    """
+    Mean over frames of the RMS difference of the log power spectra (dB).
+    Both spectra are floored `floor_db` below the clean peak, so empty bins
+    of the reference don't dominate the distance.
+    """
+    clean_power = _power_spectrogram(clean, n_fft, hop)
+    floor = clean_power.max() * 10 ** (floor_db / 10) + 1e-20
+    clean_db = 10 * np.log10(np.maximum(clean_power, floor))
+    estimate_db = 10 * np.log10(np.maximum(_power_spectrogram(estimate, n_fft, hop), floor))
+    return float(np.mean(np.sqrt(np.mean((clean_db - estimate_db) ** 2, axis=1))))
+
+
+@lru_cache(maxsize=4)
+def _third_octave_bands(sr, n_fft, n_bands=15, min_freq=150):
+    """(bands, bins) 0/1 matrix grouping FFT bins into one-third octave bands."""
+    freqs = np.linspace(0, sr / 2, n_fft // 2 + 1)
+    centres = min_freq * 2 ** (np.arange(n_bands) / 3)
+    low = centres * 2 ** (-1 / 6)
+    high = centres * 2 ** (1 / 6)
+    return ((freqs >= low[:, np.newaxis]) & (freqs < high[:, np.newaxis])).astype(np.float64)
+
+
+def intelligibility(clean, estimate, sr=16000, segment_frames=30, dynamic_range_db=40.0,
+                    clip_db=-15.0):
+    """
+    STOI-style intelligibility proxy (0..1): correlation of one-third octave
+    band envelopes over ~384 ms segments, after dropping frames more than
+    `dynamic_range_db` below the loudest clean frame.
+    """
+    target_sr, n_fft, frame_len, hop = 10000, 512, 256, 128
+    clean = resample(clean, sr, target_sr)
+    estimate = resample(estimate, sr, target_sr)
+
+    # Drop silent frames (judged on the clean signal)
+    clean_frames = _frames(clean, frame_len, hop)
+    energy_db = 10 * np.log10(np.einsum("ij,ij->i", clean_frames, clean_frames) + 1e-10)
+    keep = energy_db > energy_db.max() - dynamic_range_db
+
+    window = get_window("hann", frame_len)
+    bands = _third_octave_bands(target_sr, n_fft)
+    envelopes = []
+    for audio in (clean, estimate):
+        spectrum = rfft(_frames(audio, frame_len, hop)[keep] * window, n_fft, axis=1)
+        envelopes.append(np.sqrt((spectrum.real ** 2 + spectrum.imag ** 2) @ bands.T).T)
+    clean_env, estimate_env = envelopes  # (bands, frames)
+
+    n_frames = clean_env.shape[1]
+    if n_frames < segment_frames:
+        return float("nan")
+
+    # All overlapping segments at once: (bands, segments, segment_frames)
+    x = sliding_window_view(clean_env, segment_frames, axis=1)
+    y = sliding_window_view(estimate_env, segment_frames, axis=1)
+
+    # Normalize the estimate to the clean energy, then clip its excess
+    y = y * (np.linalg.norm(x, axis=2, keepdims=True) / (np.linalg.norm(y, axis=2, keepdims=True) + 1e-10))
+    y = np.minimum(y, x * (1 + 10 ** (-clip_db / 20)))
+
+    x = x - x.mean(axis=2, keepdims=True)
+    y = y - y.mean(axis=2, keepdims=True)
+    correlation = np.sum(x * y, axis=2) / (np.linalg.norm(x, axis=2) * np.linalg.norm(y, axis=2) + 1e-10)
+    return float(np.mean(correlation))
+
+
+def score(clean, estimate, sr=16000):
+    """All metrics of `estimate` against `clean` (1-D float arrays, same length)."""
+    return {
+        "seg_snr": segmental_snr(clean, estimate, sr),
+        "si_sdr": si_sdr(clean, estimate),
+        "lsd": log_spectral_distance(clean, estimate),
+        "intelligibility": intelligibility(clean, estimate, sr),
+    }
+
+
+# --- Corpus ---------------------------------------------------------------
+
+def load_wav(path, sr=16000):
+    """Read a WAV file as mono float32 at `sr`."""
+    file_sr, audio = wavfile.read(path)
+    return resample(pcm_to_float(audio), file_sr, sr).astype(np.float32)
+
+
+def find_pairs(clean_dir, noisy_dir):
+    """(clean_path, noisy_path) for every WAV name present in both directories."""
+    clean_names = {name for name in os.listdir(clean_dir) if name.lower().endswith(".wav")}
+    return [(os.path.join(clean_dir, name), os.path.join(noisy_dir, name))
+            for name in sorted(clean_names) if os.path.exists(os.path.join(noisy_dir, name))]
+
+
+# --- Worker processes -----------------------------------------------------
+
+_denoiser = None
+
+
+def _init_worker(engine, backend, torch_threads):
+    """Process-pool initializer: one denoiser per worker process."""
+    global _denoiser
+    import torch
+    from dsp.denoiser import Denoiser
+
+    torch.set_num_threads(torch_threads)
+    _denoiser = Denoiser(model_name=engine, device="cpu", backend=backend)
+    _denoiser.warm_up()
+
+
+def enhance(denoiser, audio, sr=16000, chunk=4096):
+    """
+    Run `audio` through a per-session stream in `chunk`-sized pieces, as the
+    server does, and undo the stream latency so output aligns with input.
+    """
+    stream = denoiser.streamer(sr=sr)
+    padded = np.concatenate([audio, np.zeros(stream.latency + chunk, dtype=np.float32)])
+    n_chunks = -(-(len(audio) + stream.latency) // chunk)
+    out = np.concatenate([stream.process(padded[i * chunk:(i + 1) * chunk]) for i in range(n_chunks)])
+    return out[stream.latency:stream.latency + len(audio)]
+
+
+def _evaluate_pair(pair, sr):
+    clean_path, noisy_path = pair
+    clean = load_wav(clean_path, sr)
+    noisy = load_wav(noisy_path, sr)
+    n = min(len(clean), len(noisy))
+    clean, noisy = clean[:n], noisy[:n]
+
+    start = time.perf_counter()
+    enhanced = enhance(_denoiser, noisy, sr)
+    elapsed = time.perf_counter() - start
+
+    row = {
+        "file": os.path.basename(clean_path),
+        "engine": _denoiser.name,
+        "backend": _denoiser.backend,
+        "duration_s": n / sr,
+        "rtf": elapsed / (n / sr) if n else 0.0,
+    }
+    row.update({f"noisy_{k}": v for k, v in score(clean, noisy, sr).items()})
+    row.update(score(clean, enhanced, sr))
+    return row
+
+
+def evaluate_corpus(pairs, engines=("dns64",), backend="eager", workers=None, torch_threads=1,
+                    sr=16000):
+    """
+    Score every pair under every engine.
+    pairs: list of (clean_path, noisy_path)
+    engines: Denoiser model names (e.g. "dns64", "spectral", "highpass")
+    workers: worker processes per engine (default: one per CPU core)
+    returns: list of per-file result dicts
+    """
+    workers = workers or os.cpu_count() or 1
+    ctx = mp.get_context("spawn")
+    rows = []
+    for engine in engines:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(engine, backend, torch_threads)) as pool:
+            rows.extend(pool.map(_evaluate_pair, pairs, [sr] * len(pairs)))
+    return rows
+
+
+def summarize(rows):
+    """Per-engine means of every metric, plus the improvement over the noisy input."""
+    summary = {}
+    for engine in sorted({row["engine"] for row in rows}):
+        engine_rows = [row for row in rows if row["engine"] == engine]
+        entry = {"files": len(engine_rows),
+                 "rtf": float(np.mean([row["rtf"] for row in engine_rows]))}
+        for metric in METRICS:
+            enhanced = float(np.nanmean([row[metric] for row in engine_rows]))
+            noisy = float(np.nanmean([row[f"noisy_{metric}"] for row in engine_rows]))
+            entry[metric] = enhanced
+            entry[f"noisy_{metric}"] = noisy
+            entry[f"delta_{metric}"] = enhanced - noisy
+        summary[engine] = entry
+    return summary
+
+
+def write_report(rows, csv_path=None, json_path=None):
+    """Write per-file rows to CSV and/or rows plus per-engine summary to JSON."""
+    if csv_path and rows:
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summarize(rows), "files": rows}, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Objective quality evaluation of denoising engines")
+    parser.add_argument("--clean", required=True, help="directory of clean reference WAVs")
+    parser.add_argument("--noisy", required=True, help="directory of noisy WAVs with the same names")
+    parser.add_argument("--engines", nargs="+", default=["dns64"],
+                        help="Denoiser model names, e.g. dns64 dns48 master64 spectral highpass")
+    parser.add_argument("--backend", default="eager", help="eager, torchscript, onnx or int8")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU cores)")
+    parser.add_argument("--torch-threads", type=int, default=1, help="torch threads per worker")
+    parser.add_argument("--csv", help="per-file CSV report path")
+    parser.add_argument("--json", help="JSON report path (summary and per-file rows)")
+    args = parser.parse_args(argv)
+
+    pairs = find_pairs(args.clean, args.noisy)
+    if not pairs:
+        parser.error("no matching WAV files in the clean and noisy directories")
+    print(f"Evaluating {len(pairs)} files with {', '.join(args.engines)}...")
+
+    rows = evaluate_corpus(pairs, args.engines, args.backend, args.workers, args.torch_threads)
+    write_report(rows, args.csv, args.json)
+
+    for engine, entry in summarize(rows).items():
+        print(f"{engine}: " + ", ".join(
+            f"{metric} {entry[metric]:.2f} ({entry[f'delta_{metric}']:+.2f})" for metric in METRICS
+        ) + f", rtf {entry['rtf']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
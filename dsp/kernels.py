@@ -0,0 +1,290 @@
+import os
+
+import numpy as np
+from scipy.ndimage import minimum_filter1d
+from scipy.signal import lfilter
+
+# Numba is optional: without it every kernel runs its NumPy version
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+BACKENDS = ("numpy", "numba")
+
+
+def available_backends():
+    """Kernel backends usable in this environment."""
+    return BACKENDS if numba is not None else ("numpy",)
+
+
+def get_backend():
+    """Name of the active kernel backend."""
+    return _backend
+
+
+def set_backend(name):
+    """
+    Switch every kernel to one backend.
+    name: "numpy", "numba" or "auto" (numba when installed)
+    """
+    global _backend
+    if name == "auto":
+        name = "numba" if numba is not None else "numpy"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown kernel backend: {name} (choose from {BACKENDS})")
+    if name == "numba" and numba is None:
+        raise ImportError("Kernel backend 'numba' requested but numba is not installed")
+    _backend = name
+
+
+# --- NumPy versions -------------------------------------------------------
+
+def _follow_level_numpy(rms, held, level_zi, attack, release, gate):
+    # Peak hold in closed form:
+    #   held[b] = max(held[-1] * r**steps[b], max_k rms[k] * r**(steps[b] - steps[k]))
+    # where steps counts blocks above the gate
+    active = rms >= gate
+    steps = np.cumsum(active, axis=-1)
+    log_release = np.log(release)
+    candidates = np.where(active, np.log(rms + 1e-12) - steps * log_release, -np.inf)
+    candidates = np.concatenate([np.log(held)[..., np.newaxis], candidates], axis=-1)
+    held_levels = np.exp(np.maximum.accumulate(candidates, axis=-1)[..., 1:] + steps * log_release)
+
+    level, level_zi = lfilter([1 - attack], [1, -attack], held_levels, axis=-1, zi=level_zi)
+    return level, held_levels[..., -1], level_zi
+
+
+def _lookahead_gain_numpy(required, window_min, lookahead):
+    L = lookahead
+    rows = len(required)
+    minima = minimum_filter1d(required, L + 1, axis=1, origin=L // 2)[:, L:]
+    history = np.concatenate([window_min, minima], axis=1)
+    csum = np.cumsum(history, axis=1, dtype=np.float64)
+    gain = (csum[:, L:] - np.concatenate([np.zeros((rows, 1)), csum[:, :-L - 1]], axis=1)) / (L + 1)
+    return gain, history[:, -L:]
+
+
+def _gate_states_numpy(decisions, attack_frames, hangover_frames, active, run, hang):
+    states = np.empty(len(decisions), dtype=bool)
+    for i, speech in enumerate(decisions):
+        if speech:
+            run += 1
+            if not active and run >= attack_frames:
+                active = True
+            if active:
+                hang = hangover_frames
+        else:
+            run = 0
+            if active:
+                if hang > 0:
+                    hang -= 1
+                else:
+                    active = False
+        states[i] = active
+    return states, active, run, hang
+
+
+def _chunk_stats_numpy(output, clean, noisy):
+    stats = np.zeros(7)
+    if len(output):
+        stats[0] = np.dot(output, output)
+        stats[1] = output.min()
+        stats[2] = output.max()
+    if len(clean):
+        stats[3] = np.dot(clean, clean)
+    if len(noisy):
+        stats[4] = np.dot(noisy, noisy)
+        stats[5] = max(noisy.max(), -noisy.min())
+        if len(clean) == len(noisy):
+            stats[6] = np.dot(clean, noisy)
+    return stats
+
+
+# --- Numba versions (sample/block-accurate loops, compiled on first use) ---
+
+if numba is not None:
+
+    @numba.njit(cache=True)
+    def _follow_level_numba(rms, held, level_zi, attack, release, gate):
+        rows, n_blocks = rms.shape
+        level = np.empty((rows, n_blocks))
+        held_out = np.empty(rows)
+        zi_out = np.empty((rows, 1))
+        for r in range(rows):
+            h = held[r]
+            z = level_zi[r, 0]
+            for b in range(n_blocks):
+                x = rms[r, b]
+                if x >= gate:
+                    h = max(x, h * release)
+                y = (1 - attack) * h + z
+                z = attack * y
+                level[r, b] = y
+            held_out[r] = h
+            zi_out[r, 0] = z
+        return level, held_out, zi_out
+
+    @numba.njit(cache=True)
+    def _lookahead_gain_numba(required, window_min, lookahead):
+        L = lookahead
+        rows, total = required.shape
+        n = total - L
+        gain = np.empty((rows, n))
+        history_out = np.empty((rows, L))
+        history = np.empty(L + n)
+        queue = np.empty(total, dtype=np.int64)  # indices with increasing required gain
+        for r in range(rows):
+            history[:L] = window_min[r]
+            running = 0.0
+            for i in range(L):
+                running += history[i]
+            head = 0
+            tail = 0
+            for j in range(total):
+                # Sliding minimum over required[j - L .. j] with a monotonic queue
+                while tail > head and required[r, queue[tail - 1]] >= required[r, j]:
+                    tail -= 1
+                queue[tail] = j
+                tail += 1
+                if queue[head] < j - L:
+                    head += 1
+                if j < L:
+                    continue
+                i = j - L
+                m = required[r, queue[head]]
+                history[L + i] = m
+                running += m
+                gain[r, i] = running / (L + 1)
+                running -= history[i]
+            history_out[r] = history[n:]
+        return gain, history_out
+
+    @numba.njit(cache=True)
+    def _gate_states_numba(decisions, attack_frames, hangover_frames, active, run, hang):
+        states = np.empty(len(decisions), dtype=np.bool_)
+        for i in range(len(decisions)):
+            if decisions[i]:
+                run += 1
+                if not active and run >= attack_frames:
+                    active = True
+                if active:
+                    hang = hangover_frames
+            else:
+                run = 0
+                if active:
+                    if hang > 0:
+                        hang -= 1
+                    else:
+                        active = False
+            states[i] = active
+        return states, active, run, hang
+
+    @numba.njit(cache=True)
+    def _chunk_stats_numba(output, clean, noisy):
+        stats = np.zeros(7)
+        if len(output):
+            stats[1] = np.inf
+            stats[2] = -np.inf
+        paired = len(clean) == len(noisy)
+        for i in range(max(len(output), len(clean), len(noisy))):
+            if i < len(output):
+                o = output[i]
+                stats[0] += o * o
+                stats[1] = min(stats[1], o)
+                stats[2] = max(stats[2], o)
+            if i < len(clean):
+                stats[3] += clean[i] * clean[i]
+            if i < len(noisy):
+                x = noisy[i]
+                stats[4] += x * x
+                stats[5] = max(stats[5], abs(x))
+                if paired:
+                    stats[6] += clean[i] * x
+        return stats
+
+
+# --- Public kernels -------------------------------------------------------
+
+def follow_level(rms, held, level_zi, attack, release, gate=0.0):
+    """
+    Block-rate level follower: peak hold with exponential release, then a
+    one-pole attack smoother. Blocks below `gate` neither raise nor decay
+    the held level.
+    rms: block levels (..., blocks)
+    held: previous held level (...,)
+    level_zi: smoother state (..., 1)
+    attack, release: per-block smoothing coefficients (0..1)
+    returns: (level (..., blocks), held, level_zi) with the new state
+    """
+    if _backend == "numba":
+        shape = rms.shape
+        level, held, level_zi = _follow_level_numba(
+            np.ascontiguousarray(rms, dtype=np.float64).reshape(-1, shape[-1]),
+            np.ascontiguousarray(held, dtype=np.float64).reshape(-1),
+            np.ascontiguousarray(level_zi, dtype=np.float64).reshape(-1, 1),
+            float(attack), float(release), float(gate),
+        )
+        return level.reshape(shape), held.reshape(shape[:-1]), level_zi.reshape(shape[:-1] + (1,))
+    return _follow_level_numpy(rms, held, level_zi, attack, release, gate)
+
+
+def lookahead_gain(required, window_min, lookahead):
+    """
+    Smoothed look-ahead limiter gain: minimum of the required gain over the
+    window ending at each sample, box-averaged over the same length, so it
+    stays below the required gain of the sample it lands on after a delay
+    of `lookahead` samples.
+    required: (rows, lookahead + samples) required gain, previous values first
+    window_min: (rows, lookahead) previous minima
+    returns: (gain (rows, samples), window_min) with the new state
+    """
+    if _backend == "numba":
+        return _lookahead_gain_numba(np.ascontiguousarray(required, dtype=np.float64),
+                                     np.ascontiguousarray(window_min, dtype=np.float64),
+                                     int(lookahead))
+    return _lookahead_gain_numpy(required, window_min, lookahead)
+
+
+def gate_states(decisions, attack_frames, hangover_frames, active, run, hang):
+    """
+    VAD gate state machine over per-frame decisions.
+    returns: (states bool array, active, run, hang) with the new state
+    """
+    if _backend == "numba":
+        states, active, run, hang = _gate_states_numba(
+            np.asarray(decisions, dtype=np.bool_), attack_frames, hangover_frames,
+            bool(active), int(run), int(hang),
+        )
+        return states, bool(active), int(run), int(hang)
+    return _gate_states_numpy(decisions, attack_frames, hangover_frames, active, run, hang)
+
+
+_EMPTY = np.zeros(0, dtype=np.float32)
+
+
+def chunk_stats(output, clean=None, noisy=None):
+    """
+    Every per-chunk statistic in one pass over the data.
+    output, clean, noisy: 1-D float32 arrays (clean/noisy optional)
+    returns: float64 array [output energy, output min, output max, clean energy,
+             noisy energy, noisy peak, clean . noisy]; energies are sums of squares
+    """
+    arrays = [_EMPTY if a is None else np.ascontiguousarray(a, dtype=np.float32).reshape(-1)
+              for a in (output, clean, noisy)]
+    if _backend == "numba":
+        return _chunk_stats_numba(*arrays)
+    return _chunk_stats_numpy(*arrays)
+
+
+def warm_up():
+    """Compile (or load cached) kernels now instead of on the first audio chunk."""
+    follow_level(np.ones((1, 2)), np.ones(1), np.zeros((1, 1)), 0.5, 0.5)
+    lookahead_gain(np.ones((1, 3)), np.ones((1, 1)), 1)
+    gate_states(np.zeros(2, dtype=bool), 2, 10, False, 0, 0)
+    chunk_stats(np.zeros(2, dtype=np.float32), np.zeros(2, dtype=np.float32), np.zeros(2, dtype=np.float32))
+
+
+_backend = None
+set_backend(os.environ.get("DSP_KERNEL_BACKEND", "auto"))
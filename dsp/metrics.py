@@ -8,6 +8,8 @@ Created on Sat Oct  4 16:12:26 2025
 
 import numpy as np
 
+from dsp.kernels import chunk_stats
+
 
 class AudioMetrics:
     """Calculate audio quality metrics."""
@@ -62,4 +64,99 @@ class AudioMetrics:
             # If silence detected, confidence is inverse of energy
             confidence = max(1.0 - (energy / 0.1), 0.0)
         
-        return confidence
\ No newline at end of file
+        return confidence
+
+class MetricsAccumulator:
+    """
+    Per-session streaming metrics.
+    
+    Each chunk's statistics come from one fused pass (dsp.kernels.chunk_stats).
+    Per-chunk values go into fixed-size ring buffers whose windowed sums are
+    updated incrementally, so snapshot() is O(1) however long the session runs.
+    """
+    
+    # Ring buffer columns
+    _FIELDS = ("samples", "energy", "clean_energy", "noise_energy", "peak",
+               "speech", "pitch", "voiced")
+    
+    def __init__(self, window=32):
+        """
+        window: number of recent chunks the windowed values cover
+        """
+        self.window = window
+        self._ring = np.zeros((window, len(self._FIELDS)))
+        self._window_sums = np.zeros(len(self._FIELDS))
+        self._totals = np.zeros(len(self._FIELDS))
+        self._pos = 0
+        self.chunks = 0
+        self.last = {}
+    
+    def update(self, output=None, clean=None, noisy=None, is_speech=False, pitch=0.0, reference=None):
+        """
+        Record one chunk.
+        output: audio sent to the client (None if nothing was sent)
+        clean: denoised audio, noisy: original audio (for SNR)
+        is_speech: VAD decision for the chunk
+        pitch: detected pitch in Hz (0 if unvoiced)
+        reference: original audio aligned with a delayed `clean`, used for
+                   SNR instead of `noisy` (None = `noisy` is aligned)
+        returns: this chunk's metrics (dict)
+        """
+        (energy, out_min, out_max, clean_energy,
+         noisy_energy, noisy_peak, cross) = chunk_stats(output, clean, noisy if reference is None else reference)
+        if reference is not None and noisy is not None:
+            noisy_peak = float(np.max(np.abs(noisy))) if noisy.size else 0.0
+        
+        samples = 0 if output is None else output.size
+        # |noisy - clean|^2 expanded, so no difference signal is allocated
+        noise_energy = max(noisy_energy - 2 * cross + clean_energy, 0.0) if clean is not None else 0.0
+        voiced = pitch > 0
+        
+        row = np.array([samples, energy, clean_energy, noise_energy, max(out_max, -out_min),
+                        float(is_speech), pitch if voiced else 0.0, float(voiced)])
+        self._window_sums += row - self._ring[self._pos]
+        self._ring[self._pos] = row
+        self._pos = (self._pos + 1) % self.window
+        self._totals += row
+        self.chunks += 1
+        
+        if is_speech:
+            confidence = min(noisy_peak / 0.3, 1.0)
+        else:
+            confidence = max(1.0 - noisy_peak / 0.1, 0.0)
+        
+        self.last = {
+            'rms': float(np.sqrt(energy / samples)) if samples else 0.0,
+            'min': float(out_min),
+            'max': float(out_max),
+            'snr': self._snr(clean_energy, noise_energy) if clean is not None else 0.0,
+            'vad_confidence': float(confidence),
+            'pitch': float(pitch),
+        }
+        return self.last
+    
+    @staticmethod
+    def _snr(signal_energy, noise_energy):
+        if noise_energy < 1e-10:
+            return 100.0  # Very high SNR
+        return float(10 * np.log10(max(signal_energy, 1e-20) / noise_energy))
+    
+    def _summary(self, sums, chunks):
+        samples, energy, clean_energy, noise_energy, _, speech, pitch, voiced = sums
+        return {
+            'rms': float(np.sqrt(energy / samples)) if samples else 0.0,
+            'snr': self._snr(clean_energy, noise_energy) if clean_energy else 0.0,
+            'speech_ratio': float(speech / chunks) if chunks else 0.0,
+            'pitch': float(pitch / voiced) if voiced else 0.0,
+        }
+    
+    def snapshot(self):
+        """
+        Current metrics: the last chunk, the recent window and the whole session.
+        returns: dict with 'last', 'window' and 'total' entries
+        """
+        window = self._summary(self._window_sums, min(self.chunks, self.window))
+        window['peak'] = float(self._ring[:, 4].max())
+        total = self._summary(self._totals, self.chunks)
+        total['chunks'] = self.chunks
+        return {'last': self.last, 'window': window, 'total': total}
@@ -0,0 +1,347 @@
+import time
+import weakref
+
+import numpy as np
+
+from dsp.amplify import AutomaticGainControl
+from dsp.compressor import MultibandCompressor
+from dsp.denoiser import DEFAULT_STREAM_FRAMES
+from dsp.metrics import MetricsAccumulator
+from dsp.speaker_filter import SpeakerFilter
+from dsp.tone import ConfidentVoice
+from dsp.vad import VAD, VADGate
+
+
+# Settings shared by the local (main.py) and web (server.py) entry points
+DEFAULT_CONFIG = {
+    "samplerate": 16000,
+    "vad_mode": 3,             # 0 = most sensitive, 3 = strict
+    "attack_frames": 2,        # 30 ms VAD frames: open after 60 ms of speech,
+    "hangover_frames": 10,     # hold 300 ms,
+    "lookahead_frames": 1,     # 30 ms lookahead
+    "vad_min_level": 0.02,     # Peak below which a chunk is silence whatever the VAD says
+    "pitch_range": (100, 250),
+    "denoiser_mode": "chunk",  # chunk, stream, batch or pool (see server.py)
+    "stream_frames": DEFAULT_STREAM_FRAMES,  # Model frames per stream step (RTF vs latency)
+    "tone": True,
+    "tone_profile": None,      # Optional voice profile JSON for ConfidentVoice
+    "compression": True,
+    "compressor_budget_ms": 2.0,
+    "compressor_budget_action": "bypass",  # bypass or warn when over budget
+    "max_gain": 12.0,
+    "metrics_window": 32,
+}
+
+# Crossfade from the old to the new denoiser stream after a tier switch
+TIER_FADE_MS = 50.0
+
+_stream_latencies = weakref.WeakKeyDictionary()  # denoiser -> {(sr, num_frames): samples}
+
+
+def _stream_latency(denoiser, sr, num_frames):
+    """Output latency of a stream of `denoiser`, measured once per setting."""
+    latencies = _stream_latencies.setdefault(denoiser, {})
+    if (sr, num_frames) not in latencies:
+        latencies[(sr, num_frames)] = denoiser.streamer(sr=sr, num_frames=num_frames).latency
+    return latencies[(sr, num_frames)]
+
+
+def _state_bytes(obj, seen):
+    """Bytes of the arrays and tensors reachable from `obj`, each counted once."""
+    if obj is None or id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if hasattr(obj, "element_size") and hasattr(obj, "nelement"):  # torch.Tensor
+        return obj.element_size() * obj.nelement()
+    if isinstance(obj, dict):
+        return sum(_state_bytes(value, seen) for value in obj.values())
+    if isinstance(obj, (list, tuple, set)):
+        return sum(_state_bytes(value, seen) for value in obj)
+    if hasattr(obj, "__dict__") and not isinstance(obj, type):
+        return sum(_state_bytes(value, seen) for value in vars(obj).values())
+    return 0
+
+
+class Pipeline:
+    """
+    Processing chain for one session:
+    VAD gate -> speaker filter -> denoiser -> tone -> compressor -> AGC -> metrics.
+
+    Every stage keeps its state here, so one Pipeline serves one stream;
+    the denoiser model, speaker index, batcher and governor are shared.
+    Chunks exit as early as possible: silence never reaches the speaker
+    filter and a wrong speaker never reaches the denoiser. Each stage run
+    is timed and reported through `record(stage, start, duration)`.
+    """
+
+    def __init__(self, denoiser, config=None, sid=None, speaker_index=None, batcher=None,
+                 governor=None, tiers=None, record=None):
+        """
+        denoiser: shared Denoiser (or DenoiserPool in "pool" mode)
+        config: dict overriding DEFAULT_CONFIG entries
+        sid: session id (used by the batcher)
+        speaker_index: optional SpeakerIndex shared by all sessions
+        batcher: BatchScheduler, required in "batch" mode
+        governor: optional LoadGovernor choosing the denoiser tier
+        tiers: tier name -> loaded Denoiser, used with the governor
+        record: optional callback(stage, start, chunk_duration) for stage timings
+        """
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        cfg = self.config
+        self.sr = cfg["samplerate"]
+        self.sid = sid
+        self.denoiser = denoiser
+        self.batcher = batcher
+        self.governor = governor
+        self.tiers = tiers or {}
+        self.record = record
+        self.mode = cfg["denoiser_mode"]
+        if self.mode == "batch" and batcher is None:
+            raise ValueError("Denoiser mode 'batch' needs a BatchScheduler")
+
+        self.gate = VADGate(VAD(mode=cfg["vad_mode"], samplerate=self.sr),
+                            attack_frames=cfg["attack_frames"],
+                            hangover_frames=cfg["hangover_frames"],
+                            lookahead_frames=cfg["lookahead_frames"],
+                            min_level=cfg["vad_min_level"])
+        self.speaker_filter = SpeakerFilter(target_pitch_range=tuple(cfg["pitch_range"]),
+                                            samplerate=self.sr, index=speaker_index)
+        self.stream = None
+        self.stream_latency = 0  # Fixed output latency of the denoise stage (samples)
+        self._stream_delay = None  # Pads the active stream up to stream_latency
+        self._fading = None  # (old stream, its delay, samples since the switch)
+        self._reference_delay = None  # Noisy input delayed by stream_latency, for SNR
+        self._streamed = 0  # Samples fed to the denoise stream so far
+        self.streams_opened = 0  # Grows on the first stream and on tier switches
+        self._in_utterance = False  # Target speaker accepted since the gate opened
+        self.tone = None
+        if cfg["tone"]:
+            self.tone = (ConfidentVoice.from_json(cfg["tone_profile"], sr=self.sr) if cfg["tone_profile"]
+                         else ConfidentVoice(sr=self.sr))
+        self.compressor = None
+        if cfg["compression"]:
+            self.compressor = MultibandCompressor(samplerate=self.sr, budget_ms=cfg["compressor_budget_ms"],
+                                                  budget_action=cfg["compressor_budget_action"])
+        self.agc = AutomaticGainControl(samplerate=self.sr, max_gain=cfg["max_gain"])
+        self.metrics = MetricsAccumulator(window=cfg["metrics_window"])
+
+        self.timings = {}  # stage -> seconds spent on the last call
+
+    def state_bytes(self):
+        """Estimated memory held by this session's state (shared models excluded)."""
+        shared = [self.denoiser, self.batcher, self.governor, self.speaker_filter.index,
+                  self.speaker_filter.embedder]
+        shared += list(self.tiers.values())
+        shared += [getattr(denoiser, "model", None) for denoiser in [self.denoiser] + list(self.tiers.values())]
+        seen = {id(obj) for obj in shared if obj is not None}
+        return _state_bytes([self.gate, self.speaker_filter, self.stream, self._stream_delay,
+                             self._fading, self._reference_delay, self.tone, self.compressor,
+                             self.agc, self.metrics], seen)
+
+    def _time(self, stage, start, duration):
+        self.timings[stage] = time.perf_counter() - start
+        if self.record is not None:
+            self.record(stage, start, duration)
+
+    @property
+    def active_denoiser(self):
+        """The denoiser for the governor's current tier (or the shared one)."""
+        if self.governor is not None:
+            return self.tiers.get(self.governor.tier, self.denoiser)
+        return self.denoiser
+
+    def _denoise(self, segments, active):
+        """Denoise this session's accepted chunks, in order, as one 1-D array."""
+        if self.mode == "batch":
+            # Submit everything first so the chunks can share forward passes
+            futures = [self.batcher.submit(self.sid, segment) for segment in segments]
+            return np.concatenate([future.result() for future in futures])
+        if self.mode in ("chunk", "pool"):
+            return np.concatenate([self.denoiser.process(segment, sr=self.sr) for segment in segments])
+
+        audio = np.concatenate(segments)
+        if self.stream is None:
+            # Every tier's stream is padded to the slowest one, so switching
+            # tiers never makes the output jump in time
+            candidates = [self.denoiser] + list(self.tiers.values())
+            self.stream_latency = max(_stream_latency(denoiser, self.sr, self.config["stream_frames"])
+                                      for denoiser in candidates)
+            self.stream, self._stream_delay = self._open_stream(active)
+            self._reference_delay = np.zeros(self.stream_latency, dtype=np.float32)
+        elif self.stream.denoiser is not active:
+            # Tier switch: keep the old stream running until the new one has
+            # real output, then crossfade
+            self._fading = (self.stream, self._stream_delay, 0)
+            self.stream, self._stream_delay = self._open_stream(active)
+
+        out, self._stream_delay = self._stream_process(self.stream, self._stream_delay, audio)
+        if self._fading is not None:
+            old, old_delay, position = self._fading
+            old_out, old_delay = self._stream_process(old, old_delay, audio)
+            # The new stream outputs primed silence for the first stream_latency samples
+            fade = max(1, int(self.sr * TIER_FADE_MS / 1000))
+            weight = np.clip((position + np.arange(len(audio)) - self.stream_latency) / fade, 0.0, 1.0)
+            out = old_out + weight.astype(np.float32) * (out - old_out)
+            position += len(audio)
+            self._fading = None if position >= self.stream_latency + fade else (old, old_delay, position)
+        return out
+
+    def _open_stream(self, denoiser):
+        """New stream of `denoiser` and the silence that delays it to stream_latency."""
+        stream = denoiser.streamer(sr=self.sr, num_frames=self.config["stream_frames"])
+        self.streams_opened += 1
+        return stream, np.zeros(max(self.stream_latency - stream.latency, 0), dtype=np.float32)
+
+    @staticmethod
+    def _stream_process(stream, delay, audio):
+        """Run `audio` through `stream` and its delay line; returns (output, new delay)."""
+        out = np.concatenate([delay, np.asarray(stream.process(audio), dtype=np.float32).reshape(-1)])
+        return out[:len(audio)], out[len(audio):]
+
+    def _gate(self, audio):
+        try:
+            return self.gate.process(audio)
+        except Exception as vad_error:
+            print(f"VAD error: {vad_error}")
+            # Fallback: use simple amplitude threshold
+            return audio, bool(np.max(np.abs(audio)) > self.config["vad_min_level"])
+
+    def process(self, chunk):
+        """
+        Process the next chunk of this session.
+        chunk: float32 numpy array (n,) or (n, 1)
+        returns: result dict (see process_batch)
+        """
+        return self.process_batch([chunk])[0]
+
+    def process_batch(self, chunks):
+        """
+        Process several consecutive chunks of this session, e.g. a backlog.
+
+        Gating and speaker checks run per chunk. Each run of consecutive
+        chunks that pass goes through the remaining stages in one call per
+        stage. Those stages carry state across chunks, so the audio matches
+        chunk-by-chunk processing up to the tone stage's level tracking,
+        which then sees the whole run.
+
+        chunks: list of float32 numpy arrays (n,) or (n, 1)
+        returns: one dict per chunk with
+                 'status': 'silence', 'wrong_speaker' or 'processed'
+                 'audio': output clipped to [-1, 1], same shape as the chunk
+                          (None unless processed)
+                 'metrics': this chunk's MetricsAccumulator values
+                 'pitch', 'is_speech', 'tier', 'compressor_ms'
+        """
+        results = []
+        accepted = []  # (result, gated 1-D audio, original shape)
+        for chunk in chunks:
+            duration = len(chunk) / self.sr
+
+            start = time.perf_counter()
+            audio, is_speech = self._gate(chunk)
+            self._time("vad", start, duration)
+            audio = audio.reshape(-1)
+
+            result = {'status': 'silence', 'audio': None, 'is_speech': is_speech, 'pitch': 0.0,
+                      'tier': None, 'compressor_ms': 0.0}
+            results.append(result)
+            if not is_speech:
+                accepted = self._end_utterance(accepted)
+                result['metrics'] = self.metrics.update(noisy=audio, is_speech=False)
+                continue
+
+            start = time.perf_counter()
+            is_target, pitch = self.speaker_filter.is_target_speaker(audio)
+            self._time("speaker_filter", start, duration)
+            result['pitch'] = float(pitch)
+            # Pauses and unvoiced sounds inside an accepted utterance (the
+            # gate's hangover) keep the speaker decision and feed the denoiser
+            is_target = is_target or self._in_utterance
+            if not is_target:
+                accepted = self._end_utterance(accepted)
+                result['status'] = 'wrong_speaker'
+                result['metrics'] = self.metrics.update(noisy=audio, is_speech=True, pitch=pitch)
+                continue
+
+            result['status'] = 'processed'
+            self._in_utterance = True
+            accepted.append((result, audio, chunk.shape))
+
+        if accepted:
+            self._process_accepted(accepted)
+        return results
+
+    def _end_utterance(self, accepted):
+        """
+        A chunk was rejected: finish the accepted chunks before it, then drop
+        the denoise stream so its buffered tail never plays into the next
+        utterance. returns: the emptied accepted list
+        """
+        if accepted:
+            self._process_accepted(accepted)
+        self._in_utterance = False
+        if self.stream is not None:
+            self.stream = None
+            self._stream_delay = None
+            self._fading = None
+            self._reference_delay = None
+            self._streamed = 0
+        return []
+
+    def _process_accepted(self, accepted):
+        segments = [audio for _, audio, _ in accepted]
+        duration = sum(len(audio) for audio in segments) / self.sr
+
+        start = time.perf_counter()
+        active = self.active_denoiser
+        denoised = np.asarray(self._denoise(segments, active), dtype=np.float32).reshape(-1)
+        self._time("denoise", start, duration)
+
+        # Stream output lags its input by stream_latency: compare it with the
+        # noisy input from as far back, and skip SNR while the stream primes
+        reference = None
+        priming = 0  # Leading output samples that are still stream priming
+        if self.mode == "stream":
+            delayed = np.concatenate([self._reference_delay] + segments)
+            reference, self._reference_delay = delayed[:len(denoised)], delayed[len(denoised):]
+            priming = self.stream_latency - self._streamed
+            self._streamed += len(reference)
+
+        enhanced = denoised
+        if self.tone is not None:
+            start = time.perf_counter()
+            enhanced = self.tone.process(denoised)
+            self._time("tone", start, duration)
+
+        compressor_ms = 0.0
+        if self.compressor is not None:
+            start = time.perf_counter()
+            was_over_budget = self.compressor.over_budget
+            was_bypassed = self.compressor.bypassed
+            enhanced = self.compressor.process(enhanced)
+            compressor_ms = 0.0 if self.compressor.bypassed and was_bypassed else self.compressor.last_cost_ms
+            if self.compressor.over_budget and not was_over_budget:
+                action = "bypassing compressor" if self.compressor.bypassed else "compressor still on"
+                print(f"Warning: compressor cost {self.compressor.cost_ms:.2f} ms exceeds "
+                      f"{self.compressor.budget_ms:.2f} ms budget, {action}")
+            self._time("compressor", start, duration)
+
+        start = time.perf_counter()
+        amplified = np.clip(self.agc.process(enhanced), -1.0, 1.0)
+        self._time("gain", start, duration)
+
+        # Split back into the original chunks for per-chunk output and metrics
+        offset = 0
+        for result, audio, shape in accepted:
+            end = offset + len(audio)
+            output = amplified[offset:end]
+            clean = denoised[offset:end] if end > priming else None
+            result['metrics'] = self.metrics.update(
+                output, clean, audio, True, result['pitch'],
+                reference=None if reference is None else reference[offset:end])
+            result['audio'] = output.reshape(shape)
+            result['tier'] = active.name
+            result['compressor_ms'] = float(compressor_ms)
+            offset = end
@@ -0,0 +1,113 @@
+from collections import deque
+from functools import lru_cache
+
+import numpy as np
+from scipy.fft import rfft, irfft, next_fast_len
+from scipy.signal import get_window
+
+
+@lru_cache(maxsize=32)
+def _plan(n, sr, fmin, fmax, octave_cost):
+    """
+    Everything that depends only on the chunk length: FFT size, analysis
+    window, the window's own autocorrelation (for normalization), the lag
+    grid and the per-lag octave penalty. Built once per (length, settings).
+    """
+    min_lag = max(2, int(np.floor(sr / fmax)))
+    max_lag = min(int(np.ceil(sr / fmin)), n // 2)
+    n_fft = next_fast_len(n + max_lag)  # no circular wrap up to max_lag
+
+    window = get_window("hann", n).astype(np.float32)
+    window_acf = irfft(np.abs(rfft(window, n_fft)) ** 2, n_fft)[:max_lag + 1]
+    window_acf /= window_acf[0]
+
+    lags = np.arange(min_lag, max_lag + 1)
+    # Small bias toward shorter lags so subharmonics don't win ties
+    penalty = octave_cost * np.log2(lags / min_lag)
+
+    return n_fft, window, window_acf[lags], lags, penalty
+
+
+class PitchTracker:
+    """
+    Autocorrelation pitch estimator (Boersma-style windowed, normalized ACF).
+
+    Chunks are analysed in batches with one FFT pair per call; per-length
+    plans are cached. track() adds per-session median smoothing.
+    """
+
+    def __init__(self, samplerate=16000, fmin=60, fmax=400, voicing_threshold=0.45,
+                 octave_cost=0.05, history=5):
+        """
+        fmin, fmax: pitch search range in Hz
+        voicing_threshold: normalized ACF peak needed to call a chunk voiced
+        octave_cost: penalty per octave of lag above the shortest lag
+        history: voiced estimates kept for track() median smoothing
+        """
+        self.sr = samplerate
+        self.fmin = fmin
+        self.fmax = fmax
+        self.voicing_threshold = voicing_threshold
+        self.octave_cost = octave_cost
+        self._history = deque(maxlen=history)
+
+    def estimate_batch(self, chunks):
+        """
+        Estimate pitch for many equal-length chunks at once.
+        chunks: numpy array (batch, samples)
+        returns: (pitch_hz, confidence) arrays of shape (batch,);
+                 pitch is 0.0 where the chunk is unvoiced
+        """
+        chunks = np.asarray(chunks, dtype=np.float32)
+        n_fft, window, window_acf, lags, penalty = _plan(
+            chunks.shape[1], self.sr, self.fmin, self.fmax, self.octave_cost
+        )
+
+        frames = (chunks - chunks.mean(axis=1, keepdims=True)) * window
+        spectrum = rfft(frames, n_fft, axis=1)
+        acf = irfft(spectrum.real ** 2 + spectrum.imag ** 2, n_fft, axis=1)
+
+        energy = acf[:, :1]
+        r = acf[:, lags] / (energy * window_acf + 1e-12)
+
+        # Parabolic interpolation at every local maximum, so peaks that fall
+        # between integer lags are compared at their true height
+        left, centre, right = r[:, :-2], r[:, 1:-1], r[:, 2:]
+        denom = left - 2 * centre + right
+        safe = np.where(denom < -1e-12, denom, -1.0)
+        shift = np.where(denom < -1e-12, np.clip(0.5 * (left - right) / safe, -0.5, 0.5), 0.0)
+        height = centre - 0.25 * (left - right) * shift
+        is_peak = (centre >= left) & (centre >= right)
+
+        score = np.where(is_peak, height - penalty[1:-1], -np.inf)
+        best = np.argmax(score, axis=1)
+        rows = np.arange(len(chunks))
+
+        pitch = self.sr / (lags[1:-1][best] + shift[rows, best])
+        confidence = np.where(is_peak[rows, best], np.clip(height[rows, best], 0.0, 1.0), 0.0)
+        voiced = (confidence >= self.voicing_threshold) & (energy[:, 0] > 1e-10)
+
+        return np.where(voiced, pitch, 0.0), np.where(voiced, confidence, 0.0)
+
+    def estimate(self, audio):
+        """
+        Estimate pitch of one chunk.
+        audio: numpy array (samples,) or (samples, 1)
+        returns: (pitch_hz, confidence); pitch is 0.0 if unvoiced
+        """
+        if audio.ndim == 2:
+            audio = audio[:, 0]
+        pitch, confidence = self.estimate_batch(audio[np.newaxis, :])
+        return float(pitch[0]), float(confidence[0])
+
+    def track(self, audio):
+        """
+        Estimate pitch of this session's next chunk, median-smoothed over the
+        last voiced chunks to suppress octave jumps.
+        returns: (smoothed_pitch_hz, confidence); pitch is 0.0 if unvoiced
+        """
+        pitch, confidence = self.estimate(audio)
+        if pitch <= 0:
+            return 0.0, confidence
+        self._history.append(pitch)
+        return float(np.median(self._history)), confidence
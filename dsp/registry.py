@@ -0,0 +1,85 @@
+import os
+import threading
+
+import torch
+
+try:
+    from denoiser import pretrained
+except ImportError:
+    pretrained = None
+
+
+# Local weight cache; set DSP_MODEL_OFFLINE=1 to never touch the network
+MODEL_CACHE_DIR = os.environ.get(
+    "DSP_MODEL_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "voice_amplification", "models"),
+)
+MODEL_OFFLINE = os.environ.get("DSP_MODEL_OFFLINE", "0") == "1"
+
+# Pretrained Demucs variants the registry knows how to build
+MODEL_NAMES = ("dns48", "dns64", "master64", "valentini_nc")
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of denoiser models.
+
+    Each (model_name, device) pair is loaded once, from the local weight cache
+    when possible, and the same eval-mode module is handed to every caller.
+    """
+
+    def __init__(self, cache_dir=MODEL_CACHE_DIR, offline=MODEL_OFFLINE):
+        """
+        cache_dir: directory holding <model_name>.th state dicts
+        offline: if True, never download; missing weights raise FileNotFoundError
+        """
+        self.cache_dir = cache_dir
+        self.offline = offline
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def cache_path(self, model_name):
+        """Path of the cached state dict for a model."""
+        return os.path.join(self.cache_dir, f"{model_name}.th")
+
+    def get(self, model_name, device="cpu"):
+        """Return the shared model instance, loading it on first use."""
+        key = (model_name, device)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self._load(model_name).to(device)
+                model.eval()
+                self._models[key] = model
+            return model
+
+    def _load(self, model_name):
+        if pretrained is None:
+            raise ImportError("Facebook denoiser package is not installed")
+        if model_name not in MODEL_NAMES:
+            raise ValueError(f"Unknown denoiser model: {model_name}")
+
+        factory = getattr(pretrained, model_name)
+        path = self.cache_path(model_name)
+
+        if os.path.exists(path):
+            print(f"Loading {model_name} weights from cache: {path}")
+            model = factory(pretrained=False)
+            model.load_state_dict(torch.load(path, map_location="cpu"))
+            return model
+
+        if self.offline:
+            raise FileNotFoundError(f"No cached weights for {model_name} at {path} (offline mode)")
+
+        print(f"Downloading {model_name} weights...")
+        model = factory(pretrained=True)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            torch.save(model.state_dict(), path)
+        except OSError as e:
+            print(f"Warning: could not cache {model_name} weights: {e}")
+        return model
+
+
+# Shared by every Denoiser in this process
+registry = ModelRegistry()
@@ -0,0 +1,134 @@
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal
+
+
+@lru_cache(maxsize=None)
+def _ratio(src_sr, dst_sr):
+    g = gcd(int(src_sr), int(dst_sr))
+    return int(dst_sr) // g, int(src_sr) // g
+
+
+@lru_cache(maxsize=None)
+def design_filter(up, down):
+    """
+    Anti-aliasing FIR for an up/down polyphase resampler.
+    Same Kaiser-windowed design scipy.signal.resample_poly uses, built once
+    per ratio instead of once per chunk.
+    """
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+    h.setflags(write=False)
+    return h
+
+
+def pcm_to_float(audio):
+    """
+    Audio as read from a WAV file, as mono float32 in [-1, 1].
+    audio: numpy array (samples,) or (samples, channels), integer PCM or float
+    """
+    # Scale integer PCM before averaging channels, which would give floats
+    if audio.dtype == np.uint8:
+        audio = (audio.astype(np.float32) - 128) / 128
+    elif np.issubdtype(audio.dtype, np.integer):
+        audio = audio.astype(np.float32) / np.iinfo(audio.dtype).max
+    if audio.ndim == 2:
+        audio = audio.mean(axis=1)
+    return np.asarray(audio, dtype=np.float32)
+
+
+def resample(audio, src_sr, dst_sr):
+    """
+    Stateless zero-phase resampling of a whole chunk along the last axis.
+    audio: numpy array (..., samples)
+    returns: numpy array (..., ceil(samples * dst_sr / src_sr))
+    """
+    if src_sr == dst_sr:
+        return audio
+    up, down = _ratio(src_sr, dst_sr)
+    return signal.resample_poly(audio, up, down, axis=-1, window=design_filter(up, down))
+
+
+class Resampler:
+    """
+    Streaming polyphase resampler for one session.
+
+    Keeps the last input samples as filter history so consecutive chunks are
+    filtered as one continuous signal (no edge artifacts). The filter is
+    causal, adding a fixed `delay` (in output samples).
+    """
+
+    def __init__(self, src_sr, dst_sr, max_chunk=16384):
+        """
+        src_sr: input sample rate
+        dst_sr: output sample rate
+        max_chunk: initial size of the preallocated input buffer
+        """
+        self.src_sr = src_sr
+        self.dst_sr = dst_sr
+        self.up, self.down = _ratio(src_sr, dst_sr)
+
+        h = design_filter(self.up, self.down) * self.up
+        taps = -(-len(h) // self.up)  # taps per polyphase branch
+        padded = np.zeros(taps * self.up)
+        padded[:len(h)] = h
+
+        # phases[p, k] = h[p + k*up], stored time-reversed so each output is a
+        # dot product with a forward window of the input
+        self._phases = np.ascontiguousarray(padded.reshape(taps, self.up).T[:, ::-1], dtype=np.float32)
+        self.taps = taps
+        self.delay = (len(h) - 1) / 2 / self.down
+
+        self._buffer = np.zeros(taps - 1 + max_chunk, dtype=np.float32)
+        self._consumed = 0   # input samples seen so far
+        self._produced = 0   # output samples emitted so far
+
+    def process(self, audio):
+        """
+        Resample the next chunk.
+        audio: 1-D numpy array at src_sr
+        returns: 1-D float32 numpy array at dst_sr (length varies by at most one sample)
+        """
+        if self.up == self.down:
+            return np.asarray(audio, dtype=np.float32)
+
+        n = len(audio)
+        if n == 0:
+            return np.zeros(0, dtype=np.float32)
+        history = self.taps - 1
+        if history + n > len(self._buffer):
+            grown = np.zeros(history + n, dtype=np.float32)
+            grown[:history] = self._buffer[:history]
+            self._buffer = grown
+
+        # [history | new chunk] in the preallocated buffer
+        buffer = self._buffer[:history + n]
+        buffer[history:] = audio
+
+        # Every output whose newest input sample has already arrived
+        total = self._consumed + n
+        end = -(-total * self.up // self.down)
+        if end <= self._produced:
+            # No output due yet: keep the chunk as history and wait for more
+            self._buffer[:history] = buffer[n:]
+            self._consumed = total
+            return np.zeros(0, dtype=np.float32)
+        m = np.arange(self._produced, end)
+        u = m * self.down
+        newest = u // self.up - self._consumed  # index into the chunk, may be negative
+        phase = u % self.up
+
+        # Window starting at `newest` in the buffer ends at `newest` in the chunk
+        windows = sliding_window_view(buffer, self.taps)[newest]
+        out = np.einsum("ij,ij->i", windows, self._phases[phase])
+
+        # The last `history` input samples become the next call's history
+        self._buffer[:history] = buffer[n:]
+        self._consumed = total
+        self._produced = end
+
+        return out.astype(np.float32, copy=False)
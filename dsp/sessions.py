@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class _Session:
+    def __init__(self, state, size):
+        self.state = state
+        self.size = size
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()  # held while a handler works on the state
+
+
+class SessionManager:
+    """
+    Per-connection state keyed by session id (e.g. a Socket.IO sid).
+
+    `factory(sid)` builds a session's lightweight state (e.g. a Pipeline on
+    top of shared models). Sessions are kept in least-recently-used order.
+    Idle sessions and the oldest sessions beyond `max_sessions` are evicted.
+    Past `max_bytes` of estimated state, the oldest sessions that have been
+    quiet for `memory_idle_s` are evicted too, so the memory cap never drops
+    a client that is still talking. A session in use is never evicted; it
+    is recreated on its next chunk if it was dropped.
+
+    State is measured when a session is created and when its owner calls
+    `remeasure` after the state grew (e.g. a new denoiser stream).
+    """
+
+    def __init__(self, factory, max_sessions=64, idle_s=300.0, max_bytes=None, size_of=None,
+                 memory_idle_s=30.0):
+        """
+        factory: callable(sid) -> new session state
+        max_sessions: most sessions kept at once
+        idle_s: seconds without use after which a session is evicted
+        max_bytes: cap on the summed state size (None = no memory cap)
+        size_of: callable(state) -> estimated bytes, needed for max_bytes
+        memory_idle_s: seconds without use before the memory cap may evict a session
+        """
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_s = idle_s
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.memory_idle_s = memory_idle_s
+        self.evictions = 0
+        self._sessions = OrderedDict()  # sid -> _Session, least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, sid):
+        return sid in self._sessions
+
+    @property
+    def total_bytes(self):
+        """Estimated state size of all sessions, as last measured."""
+        with self._lock:
+            return sum(session.size for session in self._sessions.values())
+
+    def _measure(self, state):
+        return self.size_of(state) if self.size_of is not None else 0
+
+    def _entry(self, sid):
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is not None:
+                self._sessions.move_to_end(sid)
+                session.last_used = time.monotonic()
+                return session
+
+        # Build outside the lock: creating state may be slow
+        state = self.factory(sid)
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is None:
+                session = _Session(state, self._measure(state))
+                self._sessions[sid] = session
+            self._sessions.move_to_end(sid)
+        self.evict()
+        return session
+
+    def get(self, sid):
+        """This session's state, created on first use."""
+        return self._entry(sid).state
+
+    @contextmanager
+    def use(self, sid):
+        """Hold this session's state for the body of a with-block (one handler at a time)."""
+        while True:
+            session = self._entry(sid)
+            session.lock.acquire()
+            # evict() only drops sessions whose lock it holds: check this one
+            # was not dropped between the lookup and taking the lock
+            with self._lock:
+                if self._sessions.get(sid) is session:
+                    break
+            session.lock.release()
+        try:
+            yield session.state
+        finally:
+            session.last_used = time.monotonic()
+            session.lock.release()
+
+    def remeasure(self, sid):
+        """Re-estimate a session's state size after it changed; safe inside use()."""
+        with self._lock:
+            session = self._sessions.get(sid)
+        if session is not None:
+            session.size = self._measure(session.state)
+
+    def release(self, sid):
+        """Drop a session's state (e.g. on disconnect)."""
+        with self._lock:
+            return self._sessions.pop(sid, None) is not None
+
+    def evict(self):
+        """
+        Drop idle sessions, then the least recently used ones until the
+        count and memory limits hold.
+        returns: list of evicted session ids
+        """
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            total = sum(session.size for session in self._sessions.values())
+
+            for sid, session in list(self._sessions.items()):
+                quiet = now - session.last_used
+                over_count = len(self._sessions) > self.max_sessions
+                over_memory = (self.max_bytes is not None and total > self.max_bytes
+                               and quiet > self.memory_idle_s)
+                idle = quiet > self.idle_s
+                if not (idle or over_count or over_memory):
+                    # Remaining sessions are more recently used
+                    break
+                if sid == next(reversed(self._sessions)) and not idle:
+                    break  # Always keep the most recently used session
+                if not session.lock.acquire(blocking=False):
+                    continue  # In use right now
+                try:
+                    del self._sessions[sid]
+                    total -= session.size
+                    evicted.append(sid)
+                finally:
+                    session.lock.release()
+            self.evictions += len(evicted)
+        return evicted
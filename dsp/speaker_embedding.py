@@ -0,0 +1,268 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+import librosa
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.fft import dct, rfft
+from scipy.signal import get_window
+
+
+@lru_cache(maxsize=8)
+def _mfcc_plan(sr, n_fft, n_mels, n_mfcc):
+    """Analysis window, mel filterbank and DCT matrix, built once per setting."""
+    window = get_window("hann", n_fft).astype(np.float32)
+    mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels, fmin=60, fmax=sr / 2)
+    # Orthonormal DCT-II rows; c0 (overall loudness) is dropped
+    dct_matrix = dct(np.eye(n_mels, dtype=np.float32), norm="ortho", axis=0)[1:n_mfcc + 1]
+    return window, mel_basis.T.astype(np.float32), dct_matrix.T.astype(np.float32)
+
+
+class SpeakerProfile:
+    """
+    Compact speaker model: per-coefficient MFCC mean and variance (a diagonal
+    Gaussian) plus the acceptance threshold calibrated at enrollment.
+    """
+
+    def __init__(self, name, mean, var, threshold):
+        self.name = name
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.var = np.asarray(var, dtype=np.float32)
+        self.threshold = float(threshold)
+
+    def save(self, path):
+        """Store the profile as a .npz file."""
+        np.savez(path, name=self.name, mean=self.mean, var=self.var, threshold=self.threshold)
+
+    @classmethod
+    def load(cls, path):
+        """Load a profile written by save()."""
+        with np.load(path) as data:
+            return cls(str(data["name"]), data["mean"], data["var"], float(data["threshold"]))
+
+
+def stack_profiles(profiles):
+    """
+    Contiguous scoring matrices for many profiles.
+    returns: (weights (2D, P), offsets (P,)) such that the average per-frame
+             log-likelihood of frames X under every profile is
+             concat(mean(X**2), mean(X)) @ weights + offsets
+    """
+    means = np.stack([p.mean for p in profiles])
+    inv_var = 1.0 / np.stack([p.var for p in profiles])
+    weights = np.concatenate([-0.5 * inv_var, means * inv_var], axis=1).T
+    offsets = -0.5 * np.sum(means ** 2 * inv_var + np.log(2 * np.pi / inv_var), axis=1)
+    return np.ascontiguousarray(weights, dtype=np.float32), offsets.astype(np.float32)
+
+
+class SpeakerEmbedder:
+    """MFCC-statistics speaker enrollment and vectorized scoring."""
+
+    def __init__(self, samplerate=16000, n_mfcc=19, n_mels=40, frame_ms=32, hop_ms=10,
+                 min_db=-40.0):
+        """
+        n_mfcc: cepstral coefficients kept (after dropping c0)
+        n_mels: mel bands
+        frame_ms, hop_ms: analysis frame and hop lengths
+        min_db: frames this far below the loudest frame are ignored
+        """
+        self.sr = samplerate
+        self.n_fft = int(samplerate * frame_ms / 1000)
+        self.hop = int(samplerate * hop_ms / 1000)
+        self.n_mfcc = n_mfcc
+        self.n_mels = n_mels
+        self.min_db = min_db
+
+    def features(self, audio):
+        """
+        MFCC frames of the energetic parts of `audio`.
+        audio: numpy array (samples,) or (samples, 1)
+        returns: float32 array (frames, n_mfcc)
+        """
+        if audio.ndim == 2:
+            audio = audio[:, 0]
+        audio = np.asarray(audio, dtype=np.float32)
+        if len(audio) < self.n_fft:
+            return np.zeros((0, self.n_mfcc), dtype=np.float32)
+
+        window, mel_basis, dct_matrix = _mfcc_plan(self.sr, self.n_fft, self.n_mels, self.n_mfcc)
+
+        frames = sliding_window_view(audio, self.n_fft)[::self.hop] * window
+        spectrum = rfft(frames, axis=1)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+
+        energy_db = 10 * np.log10(power.sum(axis=1) + 1e-12)
+        power = power[energy_db > energy_db.max() + self.min_db]
+
+        log_mel = np.log(power @ mel_basis + 1e-10)
+        return (log_mel @ dct_matrix).astype(np.float32)
+
+    def enroll(self, audio, name="target", quantile=0.05, margin=1.0):
+        """
+        Build a profile from a few seconds of one speaker's audio.
+        quantile: fraction of the speaker's own 0.25 s windows allowed to
+                  score below the acceptance threshold
+        margin: extra slack (log-likelihood per coefficient) below that
+                quantile, since enrollment audio always fits its own profile best
+        returns: SpeakerProfile
+        """
+        feats = self.features(audio)
+        if len(feats) < 10:
+            raise ValueError("Not enough voiced audio to enroll a speaker")
+
+        mean = feats.mean(axis=0)
+        var = feats.var(axis=0) + 1e-3
+        profile = SpeakerProfile(name, mean, var, threshold=0.0)
+
+        # Calibrate on the speaker's own audio, cut into ~chunk-sized windows
+        per_window = max(1, int(0.25 * self.sr / self.hop))
+        n_windows = max(1, len(feats) // per_window)
+        windows = np.array_split(feats, n_windows)
+        weights, offsets = stack_profiles([profile])
+        scores = [self._score_features(w, weights, offsets)[0] for w in windows]
+        profile.threshold = float(np.quantile(scores, quantile)) - margin
+
+        return profile
+
+    def _score_features(self, feats, weights, offsets):
+        if len(feats) == 0:
+            return np.full(len(offsets), -np.inf, dtype=np.float32)
+        # Sufficient statistics of the chunk, then one product for all profiles
+        stats = np.concatenate([(feats ** 2).mean(axis=0), feats.mean(axis=0)])
+        return (stats @ weights + offsets) / feats.shape[1]
+
+    def score(self, audio, profiles):
+        """
+        Score a chunk against one or many profiles.
+        profiles: list of SpeakerProfile, or the output of stack_profiles()
+        returns: float32 array (profiles,) of average per-coefficient
+                 log-likelihoods; compare against each profile's threshold
+        """
+        if isinstance(profiles, tuple):
+            weights, offsets = profiles
+        else:
+            weights, offsets = stack_profiles(profiles)
+        return self._score_features(self.features(audio), weights, offsets)
+
+
+class SpeakerIndex:
+    """
+    Process-wide index of enrolled speaker profiles.
+
+    Profile parameters live in one preallocated (2D, capacity) matrix, so a
+    chunk is scored against every enrolled speaker with a single product.
+    When the index is full the least recently used profile is evicted, and
+    evict_idle() drops profiles nobody has used for a while.
+    """
+
+    def __init__(self, embedder=None, capacity=1024):
+        """
+        embedder: SpeakerEmbedder used for features (default: 16 kHz settings)
+        capacity: maximum number of profiles held at once
+        """
+        self.embedder = embedder or SpeakerEmbedder()
+        self.capacity = capacity
+        dim = 2 * self.embedder.n_mfcc
+
+        self._weights = np.zeros((dim, capacity), dtype=np.float32)
+        self._offsets = np.full(capacity, -np.inf, dtype=np.float32)
+        self._thresholds = np.full(capacity, np.inf, dtype=np.float32)
+        self._last_used = np.zeros(capacity)
+
+        self._slots = OrderedDict()  # key -> column, least recently used first
+        self._keys = [None] * capacity
+        self._profiles = {}
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def add(self, key, profile):
+        """Insert or replace the profile stored under `key`."""
+        weights, offsets = stack_profiles([profile])
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                if not self._free:
+                    self._evict(next(iter(self._slots)))
+                slot = self._free.pop()
+                self._slots[key] = slot
+                self._keys[slot] = key
+            self._slots.move_to_end(key)
+
+            self._weights[:, slot] = weights[:, 0]
+            self._offsets[slot] = offsets[0]
+            self._thresholds[slot] = profile.threshold
+            self._last_used[slot] = time.monotonic()
+            self._profiles[key] = profile
+
+    def get(self, key):
+        """Return the stored SpeakerProfile (or None) and mark it used."""
+        with self._lock:
+            if key not in self._slots:
+                return None
+            self._touch(key)
+            return self._profiles[key]
+
+    def remove(self, key):
+        with self._lock:
+            if key in self._slots:
+                self._evict(key)
+
+    def evict_idle(self, max_idle_s):
+        """Drop profiles unused for longer than `max_idle_s`; returns their keys."""
+        cutoff = time.monotonic() - max_idle_s
+        with self._lock:
+            idle = [key for key, slot in self._slots.items() if self._last_used[slot] < cutoff]
+            for key in idle:
+                self._evict(key)
+        return idle
+
+    def _touch(self, key):
+        self._slots.move_to_end(key)
+        self._last_used[self._slots[key]] = time.monotonic()
+
+    def _evict(self, key):
+        slot = self._slots.pop(key)
+        self._offsets[slot] = -np.inf
+        self._thresholds[slot] = np.inf
+        self._keys[slot] = None
+        del self._profiles[key]
+        self._free.append(slot)
+
+    def score(self, audio):
+        """
+        Score a chunk against every enrolled profile in one matrix product.
+        returns: (keys, scores, accepted) for the occupied slots; accepted is
+                 scores >= each profile's own threshold
+        """
+        feats = self.embedder.features(audio)
+        with self._lock:
+            slots = np.fromiter(self._slots.values(), dtype=np.intp, count=len(self._slots))
+            keys = [self._keys[s] for s in slots]
+            if len(feats) == 0 or len(slots) == 0:
+                return keys, np.full(len(slots), -np.inf, dtype=np.float32), np.zeros(len(slots), dtype=bool)
+            scores = self.embedder._score_features(feats, self._weights, self._offsets)[slots]
+            accepted = scores >= self._thresholds[slots]
+        return keys, scores, accepted
+
+    def identify(self, audio, target):
+        """
+        Check whether `target` is the best-scoring accepted speaker of a chunk.
+        returns: (is_target: bool, best_key or None)
+        """
+        keys, scores, accepted = self.score(audio)
+        if not np.any(accepted):
+            return False, None
+        best = keys[int(np.argmax(np.where(accepted, scores, -np.inf)))]
+        if best == target:
+            with self._lock:
+                if target in self._slots:
+                    self._touch(target)
+        return best == target, best
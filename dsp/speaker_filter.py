@@ -7,23 +7,66 @@ Created on Sat Oct  4 16:12:06 2025
 """
 
 import numpy as np
-from scipy.fft import rfft, rfftfreq
+
+from dsp.pitch import PitchTracker
+from dsp.speaker_embedding import SpeakerEmbedder, SpeakerProfile, stack_profiles
 
 
 class SpeakerFilter:
-    """Simple speaker recognition based on pitch range."""
+    """
+    Speaker recognition based on pitch range, or on an enrolled MFCC profile
+    once one is set (see enroll()). With a shared SpeakerIndex, the session's
+    target must also out-score every other enrolled speaker.
+    """
     
-    def __init__(self, target_pitch_range=(100, 250), samplerate=16000):
+    def __init__(self, target_pitch_range=(100, 250), samplerate=16000, profile=None,
+                 index=None, target=None):
         """
         target_pitch_range: (min_hz, max_hz) - typical male 85-180, female 165-255
+        profile: optional SpeakerProfile; when set it decides the match
+        index: optional SpeakerIndex shared by all sessions
+        target: key of this session's target profile in `index`
         """
         self.min_pitch = target_pitch_range[0]
         self.max_pitch = target_pitch_range[1]
         self.sr = samplerate
+        # Per-instance pitch smoothing: use one SpeakerFilter per session
+        self.pitch_tracker = PitchTracker(samplerate=samplerate)
+        self.index = index
+        self.target = target
+        self.embedder = index.embedder if index is not None else SpeakerEmbedder(samplerate=samplerate)
+        self.set_profile(profile)
+    
+    def set_profile(self, profile):
+        """Use `profile` (SpeakerProfile or None for pitch-only) for matching."""
+        self.profile = profile
+        self._stacked = stack_profiles([profile]) if profile is not None else None
+    
+    def select(self, target):
+        """Match against the profile stored under `target` in the shared index."""
+        self.target = target
+        if self.index is not None:
+            self.set_profile(self.index.get(target))
+    
+    def enroll(self, audio, name="target"):
+        """
+        Enroll the target speaker from a few seconds of audio; with an index the
+        profile is also stored there under `name`. Returns the profile.
+        """
+        self.set_profile(self.embedder.enroll(audio, name=name))
+        if self.index is not None:
+            self.index.add(name, self.profile)
+            self.target = name
+        return self.profile
+    
+    def load_profile(self, path):
+        """Load a profile saved with SpeakerProfile.save() and use it."""
+        self.set_profile(SpeakerProfile.load(path))
+        return self.profile
         
     def is_target_speaker(self, audio):
         """
-        Check if audio matches target speaker's pitch range.
+        Check if audio comes from the target speaker (enrolled profile, else pitch range).
         Returns: (is_match: bool, dominant_pitch: float)
         """
         if audio.ndim == 2:
@@ -33,19 +76,53 @@ class SpeakerFilter:
         if np.max(np.abs(audio)) < 0.02:
             return False, 0.0
         
-        # Get dominant frequency using FFT
-        fft = np.abs(rfft(audio))
-        freqs = rfftfreq(len(audio), 1/self.sr)
+        # Smoothed autocorrelation pitch estimate (0.0 when unvoiced)
+        dominant_pitch, _ = self.pitch_tracker.track(audio)
         
-        # Find peak in speech range (80-400 Hz)
-        speech_mask = (freqs >= 80) & (freqs <= 400)
-        if not np.any(speech_mask):
-            return False, 0.0
+        # Enrolled speakers are matched on the voice profile whatever the
+        # pitch, so their unvoiced and whispered speech gets through too
+        if self.index is not None and self.target in self.index:
+            # Score against every enrolled speaker at once; the target must win
+            is_match, _ = self.index.identify(audio, self.target)
+            return is_match, dominant_pitch
         
-        peak_idx = np.argmax(fft[speech_mask])
-        dominant_pitch = freqs[speech_mask][peak_idx]
+        if self.profile is not None:
+            # Enrolled speaker: the voice profile decides, pitch is informative
+            score = self.embedder.score(audio, self._stacked)[0]
+            return bool(score >= self.profile.threshold), dominant_pitch
         
-        # Check if in target range
+        # Nothing enrolled: unvoiced audio never matches, else check the target range
+        if dominant_pitch <= 0:
+            return False, 0.0
         is_match = self.min_pitch <= dominant_pitch <= self.max_pitch
         
-        return is_match, dominant_pitch
\ No newline at end of file
+        return is_match, dominant_pitch
+    
+    def is_target_speaker_batch(self, chunks):
+        """
+        Check many equal-length chunks at once (no per-session pitch smoothing);
+        enrolled profiles decide the match as in is_target_speaker().
+        chunks: numpy array (batch, samples)
+        Returns: (is_match: bool array, pitch: float array)
+        """
+        chunks = np.asarray(chunks, dtype=np.float32)
+        pitch, _ = self.pitch_tracker.estimate_batch(chunks)
+        
+        loud = np.max(np.abs(chunks), axis=1) >= 0.02
+        pitch = np.where(loud, pitch, 0.0)
+        voiced = pitch > 0
+        
+        # Same decision order as is_target_speaker: index, then profile (every
+        # loud row, voiced or not), then pitch range
+        if self.index is not None and self.target in self.index:
+            is_match = np.zeros(len(chunks), dtype=bool)
+            for i in np.flatnonzero(loud):
+                is_match[i], _ = self.index.identify(chunks[i], self.target)
+        elif self.profile is not None:
+            is_match = np.zeros(len(chunks), dtype=bool)
+            for i in np.flatnonzero(loud):
+                is_match[i] = self.embedder.score(chunks[i], self._stacked)[0] >= self.profile.threshold
+        else:
+            is_match = voiced & (pitch >= self.min_pitch) & (pitch <= self.max_pitch)
+        
+        return is_match, pitch
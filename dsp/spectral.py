@@ -0,0 +1,136 @@
+import numpy as np
+from scipy.fft import rfft, irfft
+from scipy.signal import get_window
+
+from dsp.vad import VAD, VALID_RATES
+
+
+class SpectralGate:
+    """
+    Streaming STFT spectral-subtraction denoiser.
+
+    Uses 50%-overlap sqrt-Hann frames whose hop is one VAD frame, so every
+    hop gets its own speech/non-speech decision. The noise spectrum is learned
+    from non-speech hops only. Overlap-add state and the noise profile carry
+    over between chunks. Each call returns as many samples as it receives,
+    with a fixed latency of two hops.
+    """
+
+    def __init__(self, sr=16000, frame_ms=10, vad_mode=3,
+                 over_subtraction=1.5, floor=0.1, noise_smoothing=0.9):
+        """
+        sr: sample rate
+        frame_ms: hop size (10, 20 or 30 so it is also a valid VAD frame)
+        vad_mode: webrtcvad aggressiveness used to pick noise-only frames
+        over_subtraction: how many times the noise estimate to subtract
+        floor: minimum per-bin gain (limits musical noise)
+        noise_smoothing: weight of the old noise profile when updating
+        """
+        self.sr = sr
+        self.hop = int(sr * frame_ms / 1000)
+        self.n_fft = 2 * self.hop
+        self.over_subtraction = over_subtraction
+        self.floor_power = floor ** 2
+        self.noise_smoothing = noise_smoothing
+        self.latency = 2 * self.hop
+
+        # sqrt-Hann analysis and synthesis: squared window sums to 1 at 50% overlap
+        self.window = np.sqrt(get_window("hann", self.n_fft)).astype(np.float32)
+
+        self.vad = VAD(mode=vad_mode, samplerate=sr, frame_ms=frame_ms) if sr in VALID_RATES else None
+
+        self.noise_psd = None
+        self._prev_block = np.zeros(self.hop, dtype=np.float32)  # analysis overlap
+        self._ola_tail = np.zeros(self.hop, dtype=np.float32)    # synthesis overlap
+        self._pending_in = np.zeros(0, dtype=np.float32)
+        self._pending_out = np.zeros(self.hop, dtype=np.float32)
+
+    def _noise_frames(self, blocks, power):
+        """Boolean mask of hops that contain no speech."""
+        if self.vad is not None:
+            pcm = (np.clip(blocks, -1.0, 1.0) * 32767).astype(np.int16)
+            return np.array([not self.vad.is_speech(row.tobytes()) for row in pcm])
+
+        # No VAD at this rate: treat frames close to the current noise floor as noise
+        frame_power = power.mean(axis=1)
+        if self.noise_psd is None:
+            return frame_power <= np.percentile(frame_power, 20)
+        return frame_power <= 2.0 * self.noise_psd.mean()
+
+    def _update_noise(self, power, noise):
+        if np.any(noise):
+            estimate = power[noise].mean(axis=0)
+        elif self.noise_psd is None:
+            # Nothing marked as noise yet: start from a minimum-statistics guess
+            estimate = power.min(axis=0)
+        else:
+            return
+
+        if self.noise_psd is None:
+            self.noise_psd = estimate
+        else:
+            self.noise_psd = self.noise_smoothing * self.noise_psd + (1 - self.noise_smoothing) * estimate
+
+    def process(self, audio):
+        """
+        Denoise the next chunk.
+        audio: numpy array (frame_len, 1) or (frame_len,)
+        returns: float32 numpy array same shape as input, delayed by `latency`
+        """
+        original_shape = audio.shape
+        if audio.ndim == 2:
+            audio = audio[:, 0]
+        n = len(audio)
+
+        pending = np.concatenate([self._pending_in, np.asarray(audio, dtype=np.float32)])
+        hops = len(pending) // self.hop
+
+        if hops:
+            blocks = pending[:hops * self.hop].reshape(hops, self.hop)
+            self._pending_in = pending[hops * self.hop:]
+
+            # Frame k = [block k-1 | block k]
+            previous = np.concatenate([self._prev_block[np.newaxis], blocks[:-1]])
+            frames = np.concatenate([previous, blocks], axis=1) * self.window
+            self._prev_block = blocks[-1].copy()
+
+            spectrum = rfft(frames, axis=1)
+            power = spectrum.real ** 2 + spectrum.imag ** 2
+
+            self._update_noise(power, self._noise_frames(blocks, power))
+
+            # Power spectral subtraction with a gain floor
+            gain = 1.0 - self.over_subtraction * self.noise_psd / (power + 1e-12)
+            gain = np.sqrt(np.maximum(gain, self.floor_power))
+
+            out_frames = irfft(spectrum * gain, n=self.n_fft, axis=1).astype(np.float32) * self.window
+
+            # Overlap-add: first half of each frame + second half of the previous one
+            tails = np.concatenate([self._ola_tail[np.newaxis], out_frames[:-1, self.hop:]])
+            out = (out_frames[:, :self.hop] + tails).ravel()
+            self._ola_tail = out_frames[-1, self.hop:].copy()
+
+            self._pending_out = np.concatenate([self._pending_out, out])
+        else:
+            self._pending_in = pending
+
+        denoised = self._pending_out[:n]
+        if len(denoised) < n:
+            denoised = np.pad(denoised, (0, n - len(denoised)))
+        self._pending_out = self._pending_out[n:]
+
+        if len(original_shape) == 2:
+            denoised = denoised.reshape(-1, 1)
+
+        return denoised
+
+
+def spectral_gate(audio, sr=16000):
+    """
+    Stateless spectral gating of a single chunk (noise learned from the chunk).
+    audio: numpy array (samples,)
+    returns: float32 numpy array, same length and alignment as the input
+    """
+    gate = SpectralGate(sr)
+    padded = np.concatenate([np.asarray(audio, dtype=np.float32), np.zeros(gate.latency, dtype=np.float32)])
+    return gate.process(padded)[gate.latency:]
@@ -0,0 +1,110 @@
+import threading
+from bisect import bisect_left
+
+
+# Latency bucket upper bounds in seconds (a 4096-sample chunk at 16 kHz is 0.256 s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram: one bisect and one increment per observation."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper_bound, cumulative count) pairs, ending with +Inf."""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+class Telemetry:
+    """
+    Process-wide pipeline instrumentation.
+
+    Stage timings go into per-stage histograms and chunk outcomes into
+    counters. Gauges and externally kept counters are read from callbacks
+    at scrape time. render() produces the Prometheus text exposition format.
+    """
+
+    def __init__(self, prefix="voice", buckets=DEFAULT_BUCKETS):
+        """
+        prefix: metric name prefix
+        buckets: latency histogram bucket bounds in seconds
+        """
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self.stages = {}    # stage -> Histogram
+        self.counters = {}  # status -> count
+        self.readers = {}   # name -> (metric type, help, callable)
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        """Record one run of `stage` that took `seconds`."""
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def count(self, status, amount=1):
+        """Increment the chunk counter for `status` (e.g. "processed")."""
+        with self._lock:
+            self.counters[status] = self.counters.get(status, 0) + amount
+
+    def gauge(self, name, help_text, read):
+        """Register a gauge whose value `read()` returns at scrape time."""
+        self.readers[name] = ("gauge", help_text, read)
+
+    def counter(self, name, help_text, read):
+        """Register a counter kept elsewhere; `read()` returns its running total."""
+        self.readers[name] = ("counter", help_text, read)
+
+    def render(self):
+        """All metrics in Prometheus text format (version 0.0.4)."""
+        p = self.prefix
+        with self._lock:
+            stages = {stage: (h.cumulative(), h.sum, h.count) for stage, h in self.stages.items()}
+            counters = dict(self.counters)
+
+        lines = [
+            f"# HELP {p}_stage_seconds Processing time per pipeline stage per chunk",
+            f"# TYPE {p}_stage_seconds histogram",
+        ]
+        for stage, (cumulative, total, count) in sorted(stages.items()):
+            for bound, running in cumulative:
+                lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="{_format_bound(bound)}"}} {running}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {total!r}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {count}')
+
+        lines += [
+            f"# HELP {p}_chunks_total Audio chunks handled, by outcome",
+            f"# TYPE {p}_chunks_total counter",
+        ]
+        for status, count in sorted(counters.items()):
+            lines.append(f'{p}_chunks_total{{status="{status}"}} {count}')
+
+        for name, (kind, help_text, read) in sorted(self.readers.items()):
+            lines += [
+                f"# HELP {p}_{name} {help_text}",
+                f"# TYPE {p}_{name} {kind}",
+                f"{p}_{name} {float(read())!r}",
+            ]
+
+        return "\n".join(lines) + "\n"
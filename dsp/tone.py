@@ -1,36 +1,134 @@
+import json
+
 import numpy as np
-import librosa
-import scipy.signal as sp
+
+from dsp.effects import EffectsChain
+
+
+# Linear EQ before the tanh compressor: 1️⃣ preemphasis, 2️⃣ low–mid boost (fuller voice)
+DEFAULT_PRE_EQ = (
+    {"type": "preemphasis", "coef": 0.97},
+    {"type": "band_boost", "low": 100, "high": 800, "amount": 0.4, "order": 2},
+)
+
+# Linear EQ after the compressor: 4️⃣ slight high boost for clarity
+DEFAULT_POST_EQ = (
+    {"type": "high_boost", "freq": 3000, "amount": 0.2, "order": 1},
+)
+
+
+class ConfidentVoice:
+    """
+    Streaming tone enhancement for one session.
+
+    The EQ stages are declarative effect chains (see dsp.effects), each
+    compiled into one SOS cascade. Their state carries across chunks, the
+    room reverb is a running-sum box filter with carried history, and the
+    output level follows a smoothed peak instead of being normalized per
+    chunk, so loudness does not pump from chunk to chunk.
+    """
+
+    def __init__(self, sr=16000, pre_eq=DEFAULT_PRE_EQ, drive=2.5, post_eq=DEFAULT_POST_EQ,
+                 reverb_len=400, reverb_mix=0.3, target_peak=1.0, release_s=0.5, max_gain=20.0):
+        """
+        sr: sample rate
+        pre_eq: effect dicts applied before compression
+        drive: tanh compression drive
+        post_eq: effect dicts applied after compression
+        reverb_len: box reverb length in samples (room presence)
+        reverb_mix: wet share of the reverb
+        target_peak: output peak level
+        release_s: time constant for the level tracker to let go of a loud peak
+        max_gain: cap on the normalization gain (keeps near-silence quiet)
+        """
+        self.sr = sr
+        self.drive = drive
+        self.reverb_len = reverb_len
+        self.reverb_mix = reverb_mix
+        self.target_peak = target_peak
+        self.release_s = release_s
+        self.max_gain = max_gain
+
+        self.pre_eq = EffectsChain(pre_eq, sr)
+        self.post_eq = EffectsChain(post_eq, sr)
+        self.reset()
+
+    @classmethod
+    def from_json(cls, path, sr=16000):
+        """
+        Build from a voice profile JSON file: any of the constructor's keyword
+        arguments, e.g. {"pre_eq": [...], "drive": 2.0, "post_eq": [...]}.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(sr=sr, **json.load(f))
+
+    def reset(self):
+        """Forget filter, reverb and level state (e.g. for a new stream)."""
+        self.pre_eq.reset()
+        self.post_eq.reset()
+        self._reverb_tail = np.zeros(self.reverb_len)
+        self._peak = None
+        self._gain = None
+
+    def _reverb(self, audio):
+        # Box filter as a running sum: out[n] = (C[n + L] - C[n]) / L
+        L = self.reverb_len
+        extended = np.concatenate([self._reverb_tail, audio])
+        csum = np.concatenate([[0.0], np.cumsum(extended)])
+        self._reverb_tail = extended[-L:]
+        box = (csum[L + 1:] - csum[1:len(audio) + 1]) / L
+        return (1 - self.reverb_mix) * audio + self.reverb_mix * box
+
+    def _normalize(self, audio):
+        chunk_peak = float(np.max(np.abs(audio))) if len(audio) else 0.0
+        if self._peak is None:
+            self._peak = chunk_peak
+        else:
+            # Instant attack, exponential release
+            decay = np.exp(-len(audio) / (self.sr * self.release_s))
+            self._peak = max(chunk_peak, self._peak * decay)
+
+        gain = min(self.target_peak / (self._peak + 1e-6), self.max_gain)
+        if self._gain is None or gain <= self._gain:
+            # Falling gain applies at once so the chunk never overshoots
+            self._gain = gain
+            return audio * gain
+
+        # Rising gain ramps across the chunk
+        ramp = np.linspace(self._gain, gain, len(audio), endpoint=False)
+        self._gain = gain
+        return audio * ramp
+
+    def process(self, audio):
+        """
+        Enhance the next chunk.
+        audio: numpy array (samples,) or (samples, 1)
+        returns: float32 numpy array same shape as input
+        """
+        original_shape = audio.shape
+        if audio.ndim == 2:
+            audio = audio[:, 0]
+
+        # 1️⃣ + 2️⃣ Pre-compression EQ in one pass
+        audio = self.pre_eq.process(audio)
+
+        # 3️⃣ Light compression (steady loudness)
+        audio = np.tanh(audio * self.drive, out=audio)
+
+        # 4️⃣ Post-compression EQ
+        audio = self.post_eq.process(audio)
+
+        # 5️⃣ Micro reverb (room presence)
+        audio = self._reverb(audio)
+
+        # Smoothed normalization
+        audio = self._normalize(audio).astype(np.float32)
+
+        if len(original_shape) == 2:
+            audio = audio.reshape(-1, 1)
+        return audio
 
 
 def confident_voice(audio, sr):
-    """Apply tone enhancement for confident voice."""
-    
-    # Handle shape
-    if audio.ndim == 2:
-        audio = audio[:, 0]
-    
-    # 1️⃣ Preemphasis
-    audio = librosa.effects.preemphasis(audio)
-
-    # 2️⃣ Add subtle low–mid EQ boost (fuller voice)
-    b, a = sp.butter(2, [100 / (sr / 2), 800 / (sr / 2)], btype="band")
-    low_mid = sp.lfilter(b, a, audio)
-    audio = audio + 0.4 * low_mid
-
-    # 3️⃣ Light compression (steady loudness)
-    audio = np.tanh(audio * 2.5)
-
-    # 4️⃣ Slight high boost for clarity
-    b, a = sp.butter(1, [3000 / (sr / 2)], btype="high")
-    highs = sp.lfilter(b, a, audio)
-    audio = audio + 0.2 * highs
-
-    # 5️⃣ Add micro reverb (room presence)
-    reverb = np.convolve(audio, np.ones(400) / 400, mode="full")[: len(audio)]
-    audio = 0.7 * audio + 0.3 * reverb
-
-    # Normalize
-    audio = audio / (np.max(np.abs(audio)) + 1e-6)
-
-    return audio.astype(np.float32).reshape(-1, 1)
+    """Apply tone enhancement for confident voice (single chunk, no carried state)."""
+    return ConfidentVoice(sr).process(audio).reshape(-1, 1)
@@ -1,26 +1,157 @@
 import webrtcvad
 import sounddevice as sd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.io import wavfile
+
+from dsp.kernels import gate_states
+from dsp.resample import pcm_to_float, resample
+
+
+# Sample rates webrtcvad accepts
+VALID_RATES = (8000, 16000, 32000, 48000)
 
 
 class VAD:
     """Voice Activity Detector with optional live microphone test."""
 
-    def __init__(self, mode=2, samplerate=16000, frame_ms=30):
+    def __init__(self, mode=2, samplerate=16000, frame_ms=30, speech_ratio=0.3):
         """
         mode: 0–3 (0 = most sensitive, 3 = strict)
         samplerate: 8000, 16000, 32000, or 48000
         frame_ms: must be 10, 20, or 30
+        speech_ratio: fraction of speech frames for a chunk to vote "speech"
         """
         self.vad = webrtcvad.Vad(mode)
         self.samplerate = samplerate
         self.frame_ms = frame_ms
         self.frame_len = int(samplerate * frame_ms / 1000)
+        self.speech_ratio = speech_ratio
+
+        # Reused int16 buffer: [leftover from last chunk | new chunk]
+        self._pcm = np.zeros(self.frame_len, dtype=np.int16)
+        self._scratch = np.zeros(0, dtype=np.float32)
+        self._carry = 0
 
     def is_speech(self, frame_bytes):
         """Return True if this frame contains speech."""
         return self.vad.is_speech(frame_bytes, self.samplerate)
 
+    def process_chunk(self, audio):
+        """
+        Classify a chunk of any length, e.g. a 4096-sample browser block.
+        The chunk is split into valid frame_ms frames; samples that do not
+        fill a whole frame are kept and prepended to the next call.
+        audio: float32 numpy array (n,) or (n, 1) in [-1, 1]
+        returns: (per-frame decisions as a bool array, aggregate is_speech vote)
+        """
+        if audio.ndim == 2:
+            audio = audio[:, 0]
+        n = len(audio)
+        total = self._carry + n
+
+        if len(self._pcm) < total:
+            grown = np.zeros(total, dtype=np.int16)
+            grown[:self._carry] = self._pcm[:self._carry]
+            self._pcm = grown
+        if len(self._scratch) < n:
+            self._scratch = np.zeros(n, dtype=np.float32)
+
+        # Single float -> int16 conversion, straight into the reused buffer
+        scaled = self._scratch[:n]
+        np.multiply(audio, 32767, out=scaled)
+        np.clip(scaled, -32768, 32767, out=scaled)
+        self._pcm[self._carry:total] = scaled
+
+        # Zero-copy (n_frames, frame bytes) view over the whole frames
+        n_frames = total // self.frame_len
+        used = n_frames * self.frame_len
+        frames = self._pcm[:used].view(np.uint8).reshape(n_frames, 2 * self.frame_len)
+        decisions = np.fromiter(
+            (self.vad.is_speech(frame.data, self.samplerate) for frame in frames),
+            dtype=bool,
+            count=n_frames,
+        )
+
+        # Keep the partial frame for the next call
+        self._carry = total - used
+        self._pcm[:self._carry] = self._pcm[used:total]
+
+        is_speech = n_frames > 0 and bool(decisions.mean() >= self.speech_ratio)
+        return decisions, is_speech
+
+    def segment(self, audio, samplerate=None, margin_db=6.0, min_speech_ms=150,
+                min_silence_ms=300):
+        """
+        Find speech segments in a whole recording (offline labelling).
+        Frame energy and zero-crossing rate are computed for every frame in one
+        vectorized pass; webrtcvad only runs on frames that pass that screen.
+        audio: float numpy array (n,) or (n, 1) in [-1, 1]
+        samplerate: rate of `audio` (default: this VAD's rate; resampled if
+                    webrtcvad does not support it)
+        margin_db: energy above the recording's noise floor to be a candidate
+        min_speech_ms: drop segments shorter than this
+        min_silence_ms: merge segments separated by less than this
+        returns: list of (start_s, end_s) tuples
+        """
+        if audio.ndim == 2:
+            audio = audio[:, 0]
+        sr = samplerate or self.samplerate
+        if sr not in VALID_RATES:
+            audio = resample(audio, sr, self.samplerate)
+            sr = self.samplerate
+        audio = np.asarray(audio, dtype=np.float32)
+
+        frame_len = int(sr * self.frame_ms / 1000)
+        n_frames = len(audio) // frame_len
+        if n_frames == 0:
+            return []
+
+        # Non-overlapping frames as a strided view (no copy)
+        frames = sliding_window_view(audio, frame_len)[::frame_len][:n_frames]
+
+        energy_db = 10 * np.log10(np.einsum("ij,ij->i", frames, frames) / frame_len + 1e-12)
+        zcr = np.count_nonzero(np.diff(np.signbit(frames), axis=1), axis=1) / frame_len
+
+        # Loud frames, or slightly quieter noisy-spectrum frames (whispers, fricatives)
+        floor_db = np.percentile(energy_db, 10)
+        candidates = (energy_db > floor_db + margin_db) | (
+            (energy_db > floor_db + margin_db / 2) & (zcr > 0.25)
+        )
+
+        # One int16 conversion, then webrtcvad on candidates only
+        pcm = (np.clip(audio[:n_frames * frame_len], -1.0, 1.0) * 32767).astype(np.int16)
+        pcm_frames = pcm.view(np.uint8).reshape(n_frames, 2 * frame_len)
+        speech = np.zeros(n_frames, dtype=bool)
+        for i in np.flatnonzero(candidates):
+            speech[i] = self.vad.is_speech(pcm_frames[i].data, sr)
+
+        # Runs of speech frames -> [start, end) frame indices
+        edges = np.diff(np.concatenate([[0], speech.astype(np.int8), [0]]))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        if len(starts) == 0:
+            return []
+
+        # Bridge short pauses, then drop short blips
+        max_gap = min_silence_ms / self.frame_ms
+        keep = (starts[1:] - ends[:-1]) > max_gap
+        starts = np.concatenate([starts[:1], starts[1:][keep]])
+        ends = np.concatenate([ends[:-1][keep], ends[-1:]])
+        long_enough = (ends - starts) * self.frame_ms >= min_speech_ms
+
+        frame_s = frame_len / sr
+        return [(float(a * frame_s), float(b * frame_s))
+                for a, b in zip(starts[long_enough], ends[long_enough])]
+
+    def segment_file(self, path, **kwargs):
+        """
+        Find speech segments in a WAV file (see segment() for options).
+        returns: list of (start_s, end_s) tuples
+        """
+        sr, audio = wavfile.read(path)
+        return self.segment(pcm_to_float(audio), samplerate=sr, **kwargs)
+
     def float_to_bytes(self, audio):
         """Convert float32 [-1,1] numpy array to 16-bit PCM bytes."""
         if audio.ndim == 2:
@@ -48,6 +179,100 @@ class VAD:
                     print("Silence")
 
 
+class VADGate:
+    """
+    Per-session speech gate built on VAD frame decisions.
+
+    attack: consecutive speech frames needed to open (ignores clicks/bursts)
+    hangover: frames the gate stays open after speech stops (bridges pauses)
+    lookahead: frames the audio is delayed by, so the gate is already open
+    when a word onset reaches the output (no clipped onsets)
+    min_level: chunks whose peak stays below this never count as speech
+    (webrtcvad flags some low-level noise as speech)
+    """
+
+    def __init__(self, vad, attack_frames=2, hangover_frames=10, lookahead_frames=0,
+                 min_level=0.02):
+        """
+        vad: this session's VAD instance (it carries partial frames)
+        attack_frames, hangover_frames, lookahead_frames: in vad.frame_ms frames
+        min_level: peak amplitude floor for a chunk's frames to count as speech (0 = off)
+        """
+        self.vad = vad
+        self.min_level = min_level
+        self.attack_frames = attack_frames
+        self.hangover_frames = hangover_frames
+        self.active = False
+
+        self._run = 0   # consecutive speech frames while closed
+        self._hang = 0  # hangover frames left while open
+
+        # Delay line holding the last lookahead_frames of audio
+        self._ring = np.zeros(lookahead_frames * vad.frame_len, dtype=np.float32)
+        self._pos = 0
+
+    @property
+    def latency(self):
+        """Delay (samples) added to the audio by the lookahead."""
+        return len(self._ring)
+
+    def update(self, decisions):
+        """
+        Advance the state machine over per-frame VAD decisions.
+        returns: bool array, gate state after each frame
+        """
+        states, self.active, self._run, self._hang = gate_states(
+            decisions, self.attack_frames, self.hangover_frames, self.active, self._run, self._hang
+        )
+        return states
+
+    def _delay(self, audio):
+        size = len(self._ring)
+        if size == 0:
+            return audio
+
+        n = len(audio)
+        delayed = np.empty(n, dtype=np.float32)
+
+        # Oldest buffered samples come out first, in ring order
+        k = min(n, size)
+        idx = (self._pos + np.arange(k)) % size
+        delayed[:k] = self._ring[idx]
+
+        if n > size:
+            delayed[size:] = audio[:n - size]
+            self._ring[idx] = audio[n - size:]
+        else:
+            self._ring[idx] = audio
+            self._pos = (self._pos + n) % size
+
+        return delayed
+
+    def process(self, audio):
+        """
+        Gate the next chunk.
+        audio: float32 numpy array (n,) or (n, 1)
+        returns: (audio delayed by `latency`, same shape; True if the gate was
+                  open at any point in this chunk)
+        """
+        original_shape = audio.shape
+        if audio.ndim == 2:
+            audio = audio[:, 0]
+
+        decisions, _ = self.vad.process_chunk(audio)
+        if self.min_level > 0 and np.max(np.abs(audio)) <= self.min_level:
+            # Too quiet to be speech: a silent frame for the state machine
+            decisions = np.zeros_like(decisions)
+        states = self.update(decisions)
+        active = bool(states.any()) or self.active
+
+        delayed = self._delay(audio)
+        if len(original_shape) == 2:
+            delayed = delayed.reshape(-1, 1)
+
+        return delayed, active
+
+
 # --- Run directly for quick test ---
 if __name__ == "__main__":
     vad = VAD(mode=3)
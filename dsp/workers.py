@@ -0,0 +1,192 @@
+import multiprocessing as mp
+import os
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def _worker_main(shm_name, capacity, conn, model_name, device, backend, torch_threads):
+    """Worker process loop: owns one Denoiser and one shared-memory buffer."""
+    import torch
+    from dsp.denoiser import Denoiser
+
+    torch.set_num_threads(torch_threads)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buffer = np.ndarray((capacity,), dtype=np.float32, buffer=shm.buf)
+
+    try:
+        denoiser = Denoiser(model_name=model_name, device=device, backend=backend)
+        denoiser.warm_up()
+        conn.send(("ready", denoiser.use_fallback))
+
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+
+            n, sr = msg
+            try:
+                denoised = denoiser.process(buffer[:n].copy(), sr=sr)
+                m = min(len(denoised), n)
+                buffer[:m] = denoised[:m]
+                buffer[m:n] = 0.0
+                conn.send(("ok", n))
+            except Exception as e:
+                conn.send(("error", str(e)))
+    finally:
+        del buffer
+        shm.close()
+
+
+class _Worker:
+    def __init__(self, process, conn, shm, buffer):
+        self.process = process
+        self.conn = conn
+        self.shm = shm
+        self.buffer = buffer
+
+
+class DenoiserPool:
+    """
+    Pool of worker processes, each holding its own Denoiser.
+
+    Audio is exchanged through one shared-memory buffer per worker, so only a
+    tiny (length, sr) message crosses the pipe. The web process keeps the
+    socket I/O and light DSP; model inference runs outside its GIL. The pool
+    exposes the same process(audio, sr) call as Denoiser.
+    """
+
+    def __init__(self, num_workers=None, torch_threads=1, model_name="dns64",
+                 device="cpu", backend="eager", max_chunk=16384):
+        """
+        num_workers: number of worker processes (default: one per CPU core)
+        torch_threads: torch.set_num_threads() value inside each worker
+        model_name: denoiser model loaded by every worker
+        backend: Denoiser inference backend used by every worker
+        max_chunk: largest chunk (samples) a single call may send
+        """
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.torch_threads = torch_threads
+        self.max_chunk = max_chunk
+        self.use_fallback = False
+        self._worker_args = (model_name, device, backend, torch_threads)
+
+        # torch is not fork-safe once initialised, so always spawn
+        self._ctx = mp.get_context("spawn")
+        self._workers = []
+        self._idle = queue.Queue()
+
+        print(f"Starting {self.num_workers} denoiser worker(s), {torch_threads} torch thread(s) each...")
+        for _ in range(self.num_workers):
+            self._workers.append(self._spawn())
+
+        for worker in self._workers:
+            try:
+                self._wait_ready(worker)
+            except RuntimeError:
+                self.close()
+                raise
+            self._idle.put(worker)
+        self.name = "highpass" if self.use_fallback else model_name
+        print("Denoiser workers ready")
+
+    def _spawn(self):
+        """Start one worker process with its own shared-memory buffer."""
+        shm = shared_memory.SharedMemory(create=True, size=self.max_chunk * 4)
+        buffer = np.ndarray((self.max_chunk,), dtype=np.float32, buffer=shm.buf)
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(shm.name, self.max_chunk, child_conn) + self._worker_args,
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        return _Worker(process, parent_conn, shm, buffer)
+
+    def _wait_ready(self, worker):
+        try:
+            status, fallback = worker.conn.recv()
+        except EOFError:
+            raise RuntimeError("Denoiser worker exited during startup")
+        self.use_fallback = self.use_fallback or fallback
+
+    def _release(self, worker):
+        """Free a dead worker's resources."""
+        worker.conn.close()
+        worker.process.join(timeout=5)
+        worker.buffer = None
+        worker.shm.close()
+        worker.shm.unlink()
+
+    def _respawn(self, dead):
+        """Replace a worker whose process has died; returns the new worker."""
+        print(f"Warning: denoiser worker {dead.process.pid} died (exit code "
+              f"{dead.process.exitcode}), restarting it")
+        worker = self._spawn()
+        try:
+            self._wait_ready(worker)
+        except RuntimeError:
+            self._release(worker)
+            raise
+        self._release(dead)
+        self._workers[self._workers.index(dead)] = worker
+        return worker
+
+    def process(self, audio, sr=16000):
+        """
+        Denoise audio chunk on the next idle worker.
+        audio: numpy array (frame_len, 1) or (frame_len,)
+        sr: sample rate (will resample if needed)
+        returns: denoised numpy array same shape as input
+        """
+        original_shape = audio.shape
+        if audio.ndim == 2:
+            audio = audio[:, 0]
+
+        n = len(audio)
+        if n > self.max_chunk:
+            raise ValueError(f"Chunk of {n} samples exceeds pool max_chunk={self.max_chunk}")
+
+        worker = self._idle.get()
+        try:
+            worker.buffer[:n] = audio
+            worker.conn.send((n, sr))
+            status, payload = worker.conn.recv()
+            if status != "ok":
+                raise RuntimeError(f"Denoiser worker failed: {payload}")
+            denoised = worker.buffer[:n].copy()
+        except (EOFError, OSError) as e:
+            raise RuntimeError(f"Denoiser worker failed: {e!r}")
+        finally:
+            if not worker.process.is_alive():
+                # Never hand a dead worker to the next request; if the restart
+                # fails too, the next request on this slot tries again
+                try:
+                    worker = self._respawn(worker)
+                except RuntimeError as e:
+                    print(f"Warning: {e}")
+            self._idle.put(worker)
+
+        if len(original_shape) == 2:
+            denoised = denoised.reshape(-1, 1)
+
+        return denoised
+
+    def close(self):
+        """Stop all workers and release the shared-memory buffers."""
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.buffer = None
+            worker.shm.close()
+            worker.shm.unlink()
+        self._workers = []
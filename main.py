@@ -1,24 +1,22 @@
 import sounddevice as sd
 import numpy as np
-from dsp.vad import VAD
-from dsp.amplify import apply_gain
 from dsp.denoiser import Denoiser
-from dsp.speaker_filter import SpeakerFilter
-from dsp.tone import confident_voice
-from dsp.metrics import AudioMetrics
+from dsp.pipeline import Pipeline
 
 
 def main():
     # Initialize components
     print("Initializing components...")
-    vad = VAD(mode=0)  # Most sensitive (good for whispers)
-    denoiser = Denoiser()  # Facebook Denoiser
-    speaker_filter = SpeakerFilter(target_pitch_range=(100, 250))  # Adjust for your voice
-    metrics = AudioMetrics()
-    
-    gain = 8.0  # Amplification factor
     samplerate = 16000
-    frame_len = vad.frame_len
+    denoiser = Denoiser()  # Facebook Denoiser
+    # Same stages as the web server; adjust pitch_range for your voice
+    pipeline = Pipeline(denoiser, config={
+        'samplerate': samplerate,
+        'vad_mode': 0,  # Most sensitive (good for whispers)
+        'pitch_range': (100, 250),
+        'max_gain': 8.0,  # Amplification factor
+    })
+    frame_len = pipeline.gate.vad.frame_len
 
     print("\n" + "="*60)
     print("🎤 Whisper Amplifier with Real-Time Metrics")
@@ -30,35 +28,25 @@ def main():
         while True:
             # Read one frame
             input_audio, _ = stream.read(frame_len)
-            frame = vad.float_to_bytes(input_audio[:, 0])
 
-            # Check if speech is detected
-            is_speech = vad.is_speech(frame) and np.max(np.abs(input_audio)) > 0.02
+            # Gate, speaker check, denoise, tone, compression and gain
+            result = pipeline.process(input_audio)
+            pitch = result['pitch']
             
-            if is_speech:
-                # Check if it's the target speaker
-                is_target, pitch = speaker_filter.is_target_speaker(input_audio)
+            if result['status'] == 'processed':
+                chunk_metrics = result['metrics']
+                rms, snr = chunk_metrics['rms'], chunk_metrics['snr']
+                vad_conf = chunk_metrics['vad_confidence']
                 
-                if is_target:
-                    # Process audio
-                    denoised = denoiser.process(input_audio)
-                    enhanced = confident_voice(denoised, samplerate)
-                    amplified = apply_gain(enhanced, gain)
-                    
-                    # Calculate metrics
-                    rms = metrics.rms_energy(amplified)
-                    snr = metrics.snr(denoised, input_audio)
-                    vad_conf = metrics.vad_confidence(input_audio, vad, is_speech)
-                    
-                    # Output audio
-                    stream.write(amplified)
-                    
-                    # Print metrics
-                    print(f"✓ RMS: {rms:.4f} | SNR: {snr:.1f}dB | VAD: {vad_conf:.2f} | Pitch: {pitch:.0f}Hz")
-                else:
-                    # Wrong speaker - silence output
-                    stream.write(np.zeros_like(input_audio))
-                    print(f"✗ Wrong speaker (Pitch: {pitch:.0f}Hz) - filtered out")
+                # Output audio
+                stream.write(result['audio'])
+                
+                # Print metrics
+                print(f"✓ RMS: {rms:.4f} | SNR: {snr:.1f}dB | VAD: {vad_conf:.2f} | Pitch: {pitch:.0f}Hz")
+            elif result['status'] == 'wrong_speaker':
+                # Wrong speaker - silence output
+                stream.write(np.zeros_like(input_audio))
+                print(f"✗ Wrong speaker (Pitch: {pitch:.0f}Hz) - filtered out")
             else:
                 # Silence
                 stream.write(np.zeros_like(input_audio))
@@ -10,27 +10,118 @@ from flask import Flask, render_template, request
 from flask_socketio import SocketIO, emit
 import numpy as np
 import base64
-from dsp.vad import VAD
-from dsp.denoiser import Denoiser
-from dsp.speaker_filter import SpeakerFilter
-from dsp.tone import confident_voice
-from dsp.amplify import apply_gain
-from dsp.metrics import AudioMetrics
+import hmac
+import secrets
+from dsp.denoiser import Denoiser, STREAM_BACKENDS
+from dsp.speaker_embedding import SpeakerEmbedder, SpeakerIndex
+from dsp.pipeline import Pipeline
+from dsp.sessions import SessionManager
+from dsp.batching import BatchScheduler
+from dsp.workers import DenoiserPool
+from dsp.adaptive import LoadGovernor
+from dsp import kernels
+from dsp.telemetry import Telemetry
+import os
 import io
+import threading
+import time
+import traceback
 import wave
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 socketio = SocketIO(app, cors_allowed_origins="*")
 
-# Initialize components globally
-vad = None
+# Shared models are global; all per-connection DSP state lives in `sessions`
 denoiser = None
-speaker_filter = None
-metrics = AudioMetrics()
+telemetry = Telemetry()  # Stage latency histograms and chunk counters, served on /metrics
+# Enrolled voice profiles shared by all sessions; least recently used evicted when full
+speaker_index = SpeakerIndex(SpeakerEmbedder(samplerate=16000),
+                             capacity=int(os.environ.get('SPEAKER_INDEX_CAPACITY', 1024)))
+speaker_profile_idle_s = float(os.environ.get('SPEAKER_PROFILE_IDLE_S', 3600))
+# Owner token per enrolled profile name, handed to the enrolling client: only a
+# session holding it (or already targeting the profile) may select or replace it
+profile_tokens = {}
+profile_lock = threading.Lock()
+batcher = None
+pipeline_ready = threading.Event()  # Set once models are loaded and warmed up
+pipeline_error = None  # Set instead if loading or warm-up failed
+init_thread = None
+init_lock = threading.Lock()
 gain = 12.0  # Maximum amplification - increased for even more amplification
 samplerate = 16000
 
+# Denoiser scheduling: "chunk" denoises each chunk on its own (no added latency),
+# "stream" keeps per-session model state between chunks (smoother output, but
+# DENOISER_STREAM_FRAMES of latency at about the same cost, see dsp.denoiser),
+# "batch" micro-batches chunks from all sessions into one forward pass,
+# "pool" runs the model in worker processes outside this process's GIL
+denoiser_mode = os.environ.get('DENOISER_MODE', 'chunk')
+batch_max_size = int(os.environ.get('DENOISER_BATCH_SIZE', 8))
+batch_max_wait_ms = float(os.environ.get('DENOISER_BATCH_WAIT_MS', 5.0))
+denoiser_workers = int(os.environ.get('DENOISER_WORKERS', 0))  # 0 = one per CPU core
+torch_threads_per_worker = int(os.environ.get('TORCH_THREADS_PER_WORKER', 1))
+denoiser_backend = os.environ.get('DENOISER_BACKEND', 'eager')  # eager, torchscript, onnx or int8
+tone_enhancement = os.environ.get('TONE_ENHANCEMENT', '1') == '1'
+tone_profile = os.environ.get('TONE_PROFILE')  # Optional voice profile JSON (EQ chains, drive, reverb)
+multiband_compression = os.environ.get('MULTIBAND_COMPRESSION', '1') == '1'
+compressor_budget_ms = float(os.environ.get('COMPRESSOR_BUDGET_MS', 2.0))  # Per 4096-sample chunk
+compressor_budget_action = os.environ.get('COMPRESSOR_BUDGET_ACTION', 'bypass')  # bypass or warn when over budget
+
+# Per-session pipeline settings (see dsp.pipeline.DEFAULT_CONFIG)
+pipeline_config = {
+    'samplerate': samplerate,
+    'vad_mode': 3,  # Mode 3 = strict (less noise, more precise)
+    'pitch_range': (100, 250),
+    'denoiser_mode': denoiser_mode,
+    'tone': tone_enhancement,
+    'tone_profile': tone_profile,
+    'compression': multiband_compression,
+    'compressor_budget_ms': compressor_budget_ms,
+    'compressor_budget_action': compressor_budget_action,
+    'max_gain': gain,
+}
+
+# Load-adaptive quality (stream mode): step master64 -> dns48 -> spectral -> highpass
+# when processing falls behind real time, and back up when load drops
+adaptive_quality = os.environ.get('ADAPTIVE_QUALITY', '1') == '1' and denoiser_mode == 'stream'
+governor = LoadGovernor() if adaptive_quality else None
+tier_denoisers = {}  # Tier name -> Denoiser, all loaded and warmed up at startup
+
+# Per-session pipelines keyed by socket sid: freed on disconnect, evicted when
+# idle or, least recently used first, past the session count cap. Past the
+# memory cap only sessions quiet for SESSION_MEMORY_IDLE_S are evicted, so it
+# reclaims abandoned state early without dropping active clients (a streaming
+# session holds ~10 MB with dns48, ~17 MB with master64)
+max_sessions = int(os.environ.get('MAX_SESSIONS', 64))
+session_idle_s = float(os.environ.get('SESSION_IDLE_S', 300))
+session_memory_mb = float(os.environ.get('SESSION_MEMORY_MB', 256))
+session_memory_idle_s = float(os.environ.get('SESSION_MEMORY_IDLE_S', 30))
+
+def create_session(sid):
+    """Lightweight per-session state on top of the shared models."""
+    return Pipeline(denoiser, config=pipeline_config, sid=sid, speaker_index=speaker_index,
+                    batcher=batcher, governor=governor, tiers=tier_denoisers,
+                    record=record_stage)
+
+sessions = SessionManager(create_session, max_sessions=max_sessions, idle_s=session_idle_s,
+                          max_bytes=int(session_memory_mb * 1024 * 1024),
+                          size_of=Pipeline.state_bytes, memory_idle_s=session_memory_idle_s)
+
+if denoiser_mode == 'stream' and denoiser_backend not in STREAM_BACKENDS:
+    print(f"Warning: DENOISER_BACKEND={denoiser_backend} has no effect with DENOISER_MODE=stream "
+          f"(streams support {', '.join(STREAM_BACKENDS)}); use batch or pool mode for it")
+
+def create_denoiser():
+    """Build the denoiser for the configured scheduling mode."""
+    if denoiser_mode == 'pool':
+        return DenoiserPool(num_workers=denoiser_workers or None,
+                            torch_threads=torch_threads_per_worker,
+                            model_name="master64", device="cpu",
+                            backend=denoiser_backend)
+    # Master model for better denoising
+    return Denoiser(model_name="master64", device="cpu", backend=denoiser_backend)
+
 @app.route('/')
 def index():
     with open('index.html', 'r', encoding='utf-8') as f:
@@ -41,35 +132,183 @@ def flow():
     with open('audio_flow_test.html', 'r', encoding='utf-8') as f:
         return f.read()
 
+def init_pipeline():
+    """Build the shared processing pipeline and warm it up, recording a failure for /health."""
+    global pipeline_error
+    try:
+        load_pipeline()
+    except Exception as e:
+        pipeline_error = f"{type(e).__name__}: {e}"
+        print(f"Error: pipeline failed to initialize: {pipeline_error}")
+        traceback.print_exc()
+        socketio.emit('error', {'message': f'Server failed to start: {pipeline_error}'})
+        return
+    
+    pipeline_ready.set()
+    print("✓ Pipeline warmed up")
+    socketio.emit('ready', {'message': 'Server ready to process audio'})
+
+def load_pipeline():
+    """Load the shared models and warm them up before accepting audio."""
+    global denoiser, batcher
+    print("Initializing audio processing pipeline...")
+    try:
+        denoiser = create_denoiser()
+        print("✓ Pipeline ready")
+    except Exception as e:
+        print(f"Warning: Some components failed to initialize: {e}")
+        # Initialize with fallbacks
+        denoiser = create_denoiser()
+    
+    if denoiser_mode == 'batch':
+        batcher = BatchScheduler(denoiser, max_batch_size=batch_max_size,
+                                 max_wait_ms=batch_max_wait_ms, sr=samplerate)
+    
+    # Compile the DSP kernels now (DSP_KERNEL_BACKEND=numpy|numba|auto picks them)
+    kernels.warm_up()
+    print(f"✓ DSP kernels: {kernels.get_backend()}")
+    
+    # Pool workers warm up their own model before reporting in
+    if denoiser_mode != 'pool':
+        # Batch mode also compiles a graph per batch-size bucket up front
+        denoiser.warm_up(sr=samplerate, max_batch=batch_max_size if denoiser_mode == 'batch' else 1)
+    
+    if governor is not None:
+        # Load every tier now so switching under load never stalls
+        tier_denoisers[governor.tiers[0]] = denoiser
+        for tier in governor.tiers[1:]:
+            tier_denoisers[tier] = Denoiser(model_name=tier, device="cpu", backend=denoiser_backend)
+            tier_denoisers[tier].warm_up(sr=samplerate)
+
+def start_pipeline():
+    """Start loading the pipeline in the background (safe to call repeatedly)."""
+    global init_thread
+    with init_lock:
+        if init_thread is None:
+            init_thread = threading.Thread(target=init_pipeline, daemon=True)
+            init_thread.start()
+
+def is_serving_process(debug):
+    """
+    False in the debug reloader's watcher process: it only restarts the
+    serving child on code changes, so it must not load models of its own.
+    """
+    return not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return telemetry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/health')
+def health():
+    if pipeline_ready.is_set():
+        return {'status': 'ready'}, 200
+    if pipeline_error is not None:
+        return {'status': 'failed', 'error': pipeline_error}, 500
+    return {'status': 'warming_up'}, 503
+
 @socketio.on('connect')
 def handle_connect():
-    global vad, denoiser, speaker_filter
     print('Client connected')
+    start_pipeline()
     
-    # Initialize components on first connection
-    if vad is None:
-        print("Initializing audio processing pipeline...")
-        try:
-            vad = VAD(mode=3, samplerate=samplerate)  # Mode 3 = strict (less noise, more precise)
-            denoiser = Denoiser(model_name="master64", device="cpu")  # Master model for better denoising
-            speaker_filter = SpeakerFilter(target_pitch_range=(100, 250), samplerate=samplerate)
-            print("✓ Pipeline ready")
-        except Exception as e:
-            print(f"Warning: Some components failed to initialize: {e}")
-            # Initialize with fallbacks
-            vad = VAD(mode=3, samplerate=samplerate)  # Mode 3 = strict (less noise, more precise)
-            denoiser = Denoiser(model_name="master64", device="cpu")  # Master model for better denoising
-            speaker_filter = SpeakerFilter(target_pitch_range=(100, 250), samplerate=samplerate)
-    
-    emit('ready', {'message': 'Server ready to process audio'})
+    # Until warm-up is done, init_pipeline() broadcasts 'ready' when it finishes
+    if pipeline_ready.is_set():
+        sessions.get(request.sid)  # Build this session's state before its first chunk
+        emit('ready', {'message': 'Server ready to process audio'})
 
 @socketio.on('disconnect')
 def handle_disconnect():
     print('Client disconnected')
+    sessions.release(request.sid)
+    evicted = sessions.evict()
+    if evicted:
+        print(f"Evicted {len(evicted)} idle session(s)")
+    # Profiles stay enrolled for reconnects until they go idle
+    speaker_index.evict_idle(speaker_profile_idle_s)
+    with profile_lock:
+        for name in [name for name in profile_tokens if name not in speaker_index]:
+            del profile_tokens[name]
+
+def owns_profile(name, token, pipeline):
+    """Whether this session may select or replace the profile enrolled as `name`."""
+    if name not in speaker_index or pipeline.speaker_filter.target == name:
+        return True
+    expected = profile_tokens.get(name)
+    return expected is not None and token is not None and hmac.compare_digest(expected, str(token))
+
+@socketio.on('enroll')
+def handle_enroll(data):
+    """Enroll this session's target speaker from a few seconds of float32 audio."""
+    if not pipeline_ready.is_set():
+        emit('enrolled', {'status': 'loading'})
+        return
+    
+    try:
+        audio = np.frombuffer(base64.b64decode(data['audio']), dtype=np.float32)
+        name = data.get('name') or request.sid
+        with sessions.use(request.sid) as pipeline, profile_lock:
+            if not owns_profile(name, data.get('token'), pipeline):
+                emit('enrolled', {'status': 'name_taken', 'name': name})
+                return
+            if name not in speaker_index:
+                profile_tokens[name] = secrets.token_urlsafe(16)  # New owner
+            pipeline.speaker_filter.enroll(audio, name=name)
+            token = profile_tokens[name]
+        print(f"Enrolled speaker '{name}' ({len(speaker_index)} profiles)")
+        emit('enrolled', {'status': 'enrolled', 'name': name, 'token': token})
+    except Exception as e:
+        print(f"Enrollment error: {e}")
+        emit('enrolled', {'status': 'error', 'message': str(e)})
+
+@socketio.on('select_speaker')
+def handle_select_speaker(data):
+    """Target a profile enrolled earlier (e.g. by a previous session), given its owner token."""
+    if not pipeline_ready.is_set():
+        emit('enrolled', {'status': 'loading'})
+        return
+    
+    name = data.get('name')
+    if name not in speaker_index:
+        emit('enrolled', {'status': 'unknown_speaker', 'name': name})
+        return
+    with sessions.use(request.sid) as pipeline, profile_lock:
+        if not owns_profile(name, data.get('token'), pipeline):
+            emit('enrolled', {'status': 'forbidden', 'name': name})
+            return
+        pipeline.speaker_filter.select(name)
+    emit('enrolled', {'status': 'selected', 'name': name})
+
+def record_stage(stage, start, chunk_duration):
+    """Report a stage's processing time to the latency histograms and the load governor."""
+    elapsed = time.perf_counter() - start
+    telemetry.observe(stage, elapsed)
+    if governor is not None:
+        governor.record(stage, elapsed, chunk_duration)
+
+telemetry.gauge('sessions', 'Connected sessions with pipeline state', lambda: len(sessions))
+telemetry.gauge('session_state_bytes', 'Estimated per-session DSP state, all sessions',
+                lambda: sessions.total_bytes)
+telemetry.counter('session_evictions_total', 'Sessions evicted for idleness or memory so far',
+                  lambda: sessions.evictions)
+telemetry.gauge('pipeline_ready', '1 once models are loaded and warmed up', lambda: pipeline_ready.is_set())
+if governor is not None:
+    telemetry.gauge('load', 'Processing s per audio s of a chunk, as seen by the quality governor',
+                    lambda: governor.load)
+    telemetry.gauge('quality_level', 'Denoiser tier index (0 = best quality)', lambda: governor.level)
 
 @socketio.on('audio_data')
 def handle_audio(data):
     """Process incoming audio chunks from browser"""
+    if not pipeline_ready.is_set():
+        if pipeline_error is not None:
+            emit('processed_audio', {'status': 'error', 'message': f'Server failed to start: {pipeline_error}'})
+            return
+        telemetry.count('loading')
+        emit('processed_audio', {'status': 'loading'})
+        return
+    
+    handle_start = time.perf_counter()
     try:
         # Decode base64 audio data
         audio_bytes = base64.b64decode(data['audio'])
@@ -77,93 +316,83 @@ def handle_audio(data):
         # Convert bytes to numpy array (assuming float32 PCM)
         audio = np.frombuffer(audio_bytes, dtype=np.float32)
         audio = audio.reshape(-1, 1)
+        chunk_duration = len(audio) / samplerate
+        record_stage('decode', handle_start, chunk_duration)
         
         # Debug: Print audio info
         print(f"Audio shape: {audio.shape}, max: {np.max(np.abs(audio)):.4f}")
         
-        # Check if speech detected
+        # VAD -> speaker filter -> denoise -> tone -> compressor -> gain, with
+        # silence and other speakers leaving before the expensive stages
         try:
-            frame_bytes = vad.float_to_bytes(audio)
-            is_speech = vad.is_speech(frame_bytes) and np.max(np.abs(audio)) > 0.02
-            print(f"VAD result: {vad.is_speech(frame_bytes)}, max_audio: {np.max(np.abs(audio)):.4f}, is_speech: {is_speech}")
-        except Exception as vad_error:
-            print(f"VAD error: {vad_error}")
-            # Fallback: use simple amplitude threshold
-            is_speech = np.max(np.abs(audio)) > 0.02
-            print(f"Fallback VAD: is_speech: {is_speech}")
+            # One chunk at a time per session; other sessions run independently
+            with sessions.use(request.sid) as pipeline:
+                streams_opened = pipeline.streams_opened
+                result = pipeline.process(audio)
+                if pipeline.streams_opened != streams_opened:
+                    sessions.remeasure(request.sid)  # First stream or tier switch grew the state
+                speech_ratio = pipeline.metrics.snapshot()['window']['speech_ratio']
+        except Exception as processing_error:
+            print(f"Audio processing error: {processing_error}")
+            telemetry.count('error')
+            # Send error response
+            emit('processed_audio', {
+                'status': 'error',
+                'message': str(processing_error)
+            })
+            return
         
-        if is_speech:
-            try:
-                # Check if target speaker
-                is_target, pitch = speaker_filter.is_target_speaker(audio)
-                
-                if is_target:
-                    # Process audio - Use denoiser output with improved amplifier
-                    denoised = denoiser.process(audio, sr=samplerate)
-                    
-                    # Skip the aggressive tone enhancement for now
-                    # enhanced = confident_voice(denoised, samplerate)
-                    enhanced = denoised  # Use denoised audio directly
-                    
-                    # Apply improved gain processing
-                    amplified = apply_gain(enhanced, gain)
-                    
-                    # Debug: Test with simple passthrough first
-                    # amplified = audio  # Uncomment this line to test without processing
-                    
-                    # Debug: Test with very high amplification
-                    # amplified = audio * 10.0  # Uncomment for extreme amplification test
-                    
-                    # Calculate metrics
-                    rms = metrics.rms_energy(amplified)
-                    snr = metrics.snr(denoised, audio)
-                    vad_conf = metrics.vad_confidence(audio, vad, is_speech)
-                    
-                    # Convert back to bytes and base64
-                    # Ensure amplified audio is in the right range
-                    amplified_clipped = np.clip(amplified, -1.0, 1.0)
-                    
-                    # Debug: Print audio statistics
-                    print(f"Audio stats - min: {np.min(amplified_clipped):.4f}, max: {np.max(amplified_clipped):.4f}, rms: {np.sqrt(np.mean(amplified_clipped**2)):.4f}")
-                    
-                    # Convert to int16 with proper scaling
-                    amplified_int16 = (amplified_clipped * 32767).astype(np.int16)
-                    output_bytes = amplified_int16.tobytes()
-                    output_b64 = base64.b64encode(output_bytes).decode('utf-8')
-                    
-                    print(f"Sending audio back - size: {len(output_bytes)} bytes, base64 length: {len(output_b64)}")
-                    
-                    # Send processed audio and metrics back
-                    emit('processed_audio', {
-                        'audio': output_b64,
-                        'metrics': {
-                            'rms': float(rms),
-                            'snr': float(snr),
-                            'vad_confidence': float(vad_conf),
-                            'pitch': float(pitch)
-                        },
-                        'status': 'processed'
-                    })
-                else:
-                    emit('processed_audio', {
-                        'metrics': {
-                            'pitch': float(pitch)
-                        },
-                        'status': 'wrong_speaker'
-                    })
-            except Exception as processing_error:
-                print(f"Audio processing error: {processing_error}")
-                # Send error response
-                emit('processed_audio', {
-                    'status': 'error',
-                    'message': str(processing_error)
-                })
+        chunk_metrics = result['metrics']
+        print(f"VAD gate: active: {result['is_speech']}")
+        telemetry.count(result['status'])
+        
+        if result['status'] == 'processed':
+            # Debug: Print audio statistics
+            print(f"Audio stats - min: {chunk_metrics['min']:.4f}, max: {chunk_metrics['max']:.4f}, rms: {chunk_metrics['rms']:.4f}")
+            
+            # Convert to int16 with proper scaling
+            stage_start = time.perf_counter()
+            amplified_int16 = (result['audio'] * 32767).astype(np.int16)
+            output_bytes = amplified_int16.tobytes()
+            output_b64 = base64.b64encode(output_bytes).decode('utf-8')
+            record_stage('encode', stage_start, chunk_duration)
+            
+            print(f"Sending audio back - size: {len(output_bytes)} bytes, base64 length: {len(output_b64)}")
+            
+            # Send processed audio and metrics back
+            stage_start = time.perf_counter()
+            emit('processed_audio', {
+                'audio': output_b64,
+                'metrics': {
+                    'rms': chunk_metrics['rms'],
+                    'snr': chunk_metrics['snr'],
+                    'vad_confidence': chunk_metrics['vad_confidence'],
+                    'pitch': result['pitch'],
+                    'speech_ratio': speech_ratio,
+                    'tier': result['tier'],
+                    'compressor_ms': result['compressor_ms']
+                },
+                'status': 'processed'
+            })
+            record_stage('emit', stage_start, chunk_duration)
+        elif result['status'] == 'wrong_speaker':
+            emit('processed_audio', {
+                'metrics': {
+                    'pitch': result['pitch']
+                },
+                'status': 'wrong_speaker'
+            })
         else:
             emit('processed_audio', {'status': 'silence'})
             
     except Exception as e:
         print(f"Error processing audio: {e}")
+        telemetry.count('error')
         emit('error', {'message': str(e)})
+    finally:
+        telemetry.observe('total', time.perf_counter() - handle_start)
 
 if __name__ == '__main__':
+    if is_serving_process(debug=True):
+        start_pipeline()
     socketio.run(app, host='0.0.0.0', port=5001, debug=True, allow_unsafe_werkzeug=True)
\ No newline at end of file
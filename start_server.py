@@ -19,7 +19,9 @@ def main():
     print("=" * 60)
     
     try:
-        from server import app, socketio
+        from server import app, socketio, start_pipeline, is_serving_process
+        if is_serving_process(debug=True):
+            start_pipeline()
         socketio.run(app, host='0.0.0.0', port=5000, debug=True)
     except KeyboardInterrupt:
         print("\n\nServer stopped by user.")
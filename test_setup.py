@@ -116,6 +116,81 @@ def test_dsp_modules():
     
     return True
 
+def test_kernels():
+    """Test that every available kernel backend matches the NumPy reference"""
+    print("\nTesting DSP kernels...")
+    
+    try:
+        import numpy as np
+        from dsp import kernels
+        from dsp.amplify import AutomaticGainControl
+        from dsp.compressor import MultibandCompressor
+        from dsp.vad import VAD, VADGate
+    except Exception as e:
+        print(f"- Kernels: {e}")
+        return False
+    
+    rng = np.random.default_rng(0)
+    audio = (rng.standard_normal((3, 4096 * 4)) * np.linspace(0.001, 0.5, 4096 * 4)).astype(np.float32)
+    speech = np.sin(2 * np.pi * 150 * np.arange(16000 * 2) / 16000).astype(np.float32) * 0.3
+    speech[8000:16000] = 0
+    
+    def run_all():
+        agc = AutomaticGainControl()
+        compressor = MultibandCompressor()
+        gate = VADGate(VAD(mode=3), attack_frames=2, hangover_frames=10)
+        chunks = np.split(audio, 4, axis=1)
+        agc_out = np.concatenate([agc.process(c) for c in chunks], axis=1)
+        compressor_out = np.concatenate([compressor.process(c) for c in chunks], axis=1)
+        decisions, _ = gate.vad.process_chunk(speech)
+        gate_out = gate.update(decisions)
+        return agc_out, compressor_out, gate_out
+    
+    original = kernels.get_backend()
+    try:
+        kernels.set_backend("numpy")
+        reference = run_all()
+        for backend in kernels.available_backends():
+            kernels.set_backend(backend)
+            results = run_all()
+            errors = [float(np.max(np.abs(np.asarray(a, dtype=np.float64) - b)))
+                      for a, b in zip(results, reference)]
+            if max(errors) > 1e-4:
+                print(f"- Kernels ({backend}): max difference {max(errors):.2e}")
+                return False
+            print(f"+ Kernels ({backend})")
+    except Exception as e:
+        print(f"- Kernels: {e}")
+        return False
+    finally:
+        kernels.set_backend(original)
+    
+    return True
+
+def test_streams():
+    """Test streaming denoising at browser sample rates (resampled around the model)"""
+    print("\nTesting denoiser streams...")
+    
+    try:
+        import numpy as np
+        from dsp.denoiser import Denoiser
+        denoiser = Denoiser(model_name="dns48", device="cpu")
+        for sr in (44100, 48000):
+            stream = denoiser.streamer(sr=sr)
+            rng = np.random.default_rng(0)
+            for _ in range(8):
+                chunk = (rng.standard_normal((4096, 1)) * 0.1).astype(np.float32)
+                out = stream.process(chunk)
+                if out.shape != chunk.shape or not np.all(np.isfinite(out)):
+                    print(f"- Stream ({sr} Hz): bad output {out.shape}")
+                    return False
+            print(f"+ Stream ({sr} Hz)")
+    except Exception as e:
+        print(f"- Streams: {e}")
+        return False
+    
+    return True
+
 def test_server():
     """Test if server can start"""
     print("\nTesting server...")
@@ -135,15 +210,19 @@ if __name__ == "__main__":
     
     imports_ok = test_imports()
     dsp_ok = test_dsp_modules()
+    kernels_ok = test_kernels()
+    streams_ok = test_streams()
     server_ok = test_server()
     
     print("\n" + "=" * 50)
     print("SUMMARY:")
     print(f"Imports: {'+' if imports_ok else '-'}")
     print(f"DSP Modules: {'+' if dsp_ok else '-'}")
+    print(f"Kernels: {'+' if kernels_ok else '-'}")
+    print(f"Streams: {'+' if streams_ok else '-'}")
     print(f"Server: {'+' if server_ok else '-'}")
     
-    if imports_ok and dsp_ok and server_ok:
+    if imports_ok and dsp_ok and kernels_ok and streams_ok and server_ok:
         print("\n[SUCCESS] All tests passed! The setup should work.")
     else:
         print("\n[WARNING] Some tests failed. Check the errors above.")